@@ -1,7 +1,16 @@
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.routes import regulation_pdf
+from app.routes import regulation_csv
 from app.routes import audit
+from app.routes import sop
+from app.routes import tenants
+from app.services.metrics import render_prometheus
+from app.services.config import WARM_TENANTS
+from app.services.tenants import warm_up
 
 app = FastAPI(
     title="GraphRAG API",
@@ -19,11 +28,26 @@ app.add_middleware(
 
 app.include_router(audit.router, prefix="/api/audit")
 app.include_router(regulation_pdf.router, prefix="/api/regulation-pdf")
+app.include_router(regulation_csv.router, prefix="/api/regulation-csv")
+app.include_router(sop.router, prefix="/api/sop")
+app.include_router(tenants.router, prefix="/api/tenants")
+
+@app.on_event("startup")
+async def warm_tenant_indexes():
+    """Preload the indexes of the tenants listed in WARM_TENANTS."""
+    if WARM_TENANTS:
+        results = await asyncio.to_thread(warm_up, WARM_TENANTS)
+        logging.info(f"Warmed tenant indexes: {results}")
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to GraphRAG API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose stage timings and pipeline counters in the Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,15 +1,24 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, BackgroundTasks, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import os
 from ..services.retrieval import get_relevant_context
-from semantic_router.encoders import HuggingFaceEncoder
-from semantic_chunkers import StatisticalChunker
+from ..services.analysis import process_chunk_with_openai, process_chunk_group_with_openai
+from ..services.prompt import group_chunks_by_context
+from ..services.llm_cache import purge_cache
+from ..services.shards import index_exists
+from ..services.metrics import start_request_timings
+from ..services.preprocess import chunk_sop_text
+from ..services.report import create_job, load_job, run_batch_audit, report_path
+from ..services.config import BATCH_AUDIT_CONCURRENCY, BATCH_AUDIT_REQUESTS_PER_MINUTE
+from ..services.tenants import TenantStorage, get_tenant_storage
 from openai import AsyncOpenAI
 import docx2txt
 import io
 import asyncio
-from typing import List, Dict
 import json
+import logging
+from typing import List, Dict
 from dotenv import load_dotenv
 
 
@@ -17,192 +26,336 @@ load_dotenv()
 
 router = APIRouter()
 
-FAISS_INDEX_PATH = "db/regulatory_index.faiss"
-SQLITE_DB_PATH = "db/chunks.db"
-
-SOP_MIN_tokens = 100
-SOP_MAX_tokens = 500
-
-encoder = HuggingFaceEncoder(name="sentence-transformers/all-MiniLM-L6-v2")
-chunker = StatisticalChunker(
-    encoder=encoder,
-    min_split_tokens=SOP_MIN_tokens,
-    max_split_tokens=SOP_MAX_tokens,
-)
-
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
 
-async def get_hybrid_context(query: str, chunk: Dict, faiss_path: str, db_path: str, top_k: int) -> Dict:
+async def get_hybrid_context(query: str, chunk: Dict, faiss_path: str, db_path: str, top_k: int,
+                             tenant: str = None) -> Dict:
     """
     Get relevant context from both vector DB and graph DB for a query + chunk combination.
     """
     enhanced_query = f"{query} context: {chunk['text']}"
 
-    context = get_relevant_context(
+    # off the event loop, so concurrent requests share embedding batches
+    context = await asyncio.to_thread(
+        get_relevant_context,
         query=enhanced_query,
         faiss_path=faiss_path,
         db_path=db_path,
-        top_k=top_k
+        top_k=top_k,
+        tenant=tenant
     )
 
     return context["results"]
 
-async def process_chunk_with_openai(
-    chunk: Dict,
-    query: str,
-    context_results: Dict,
-    client: AsyncOpenAI
-) -> Dict:
+def chunk_docx(content: bytes, filename: str) -> List[Dict]:
     """
-    Process a single chunk with OpenAI, incorporating hybrid retrieval results.
-    Returns structured analysis identifying errors with citations.
-    """
-    prompt = f"""
-    Analyze this SOP document chunk for compliance issues by comparing it with the regulatory context.
-    For each issue found, provide the following EXACT format:
-
-    ISSUE IN SOP DOCUMENT:
-    [Quote the exact text from the SOP document that contains the issue]
-
-
-
-
-    WHY ERROR:
-    [Explain specifically why this is a compliance issue or violation]
-
-    CITATION FROM CONTEXT:
-    [Quote the specific regulatory text that identifies this as an issue, including document name and page number]
-
-    If no issues are found, respond with exactly: "No compliance issues found in this section."
-
-
-    SOP DOCUMENT CHUNK:
-    {chunk['text']}
-    Source: {chunk.get('doc_name', 'Unknown')}
-
-    REGULATORY CONTEXT:
-    {json.dumps([{
-        'text': r['text'],
-        'source': r.get('doc_name', 'Unknown'),
-        'page': r.get('page_range', 'N/A')
-    } for r in context_results.get('results', [])], indent=2)}
+    Extract the text of an uploaded DOCX file and split it into SOP chunks.
     """
-    
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a compliance expert analyzing SOP documents against regulatory requirements. Identify issues using the exact format specified."},
-                {"role": "user", "content": prompt}
-            ],
-
-
-
-
-
-
-            temperature=0.1,
-            max_tokens=1000
-
-
-
+    text = docx2txt.process(io.BytesIO(content))
+    return chunk_sop_text(text, filename)
+
+def check_storage_exists(faiss_path: str, db_path: str):
+    """Raise a 400 if the regulatory index or chunk database has not been created yet."""
+    if not index_exists(faiss_path):
+        raise HTTPException(
+            status_code=400, 
+            detail="No FAISS index found. Please process some PDF documents first."
+        )
+    if not os.path.exists(db_path):
+        raise HTTPException(
+            status_code=400, 
+            detail="No SQLite database found. Please process some PDF documents first."
         )
-
-        return {
-            "chunk": chunk,
-            "analysis": response.choices[0].message.content,
-            "context": context_results,
-            "score": chunk.get('score', 0)
-        }
-    except Exception as e:
-        return {
-            "chunk": chunk,
-            "analysis": f"Error in OpenAI processing: {str(e)}",
-            "context": context_results,
-            "score": chunk.get('score', 0)
-        }
 
 @router.post("/search")
 async def search_regulations(
     query: str = Form(...),
     top_k: int = Form(5),
-    file: UploadFile = File(None)
+    file: UploadFile = File(None),
+    group_chunks: bool = Form(False),
+    include_timings: bool = Form(False),
+    storage: TenantStorage = Depends(get_tenant_storage)
 ):
     """
     Search through processed regulatory documents and optionally a new DOCX file.
     Process each chunk sequentially and return individual results.
+    With group_chunks, adjacent chunks that share most of their retrieved context
+    are analyzed together in one LLM call.
+    With include_timings, the response carries a per-stage timing breakdown.
+    The corpus is selected by the X-Tenant-ID header (default tenant when absent).
     """
+    timings = start_request_timings()
     try:
-        if not os.path.exists(FAISS_INDEX_PATH):
-            raise HTTPException(
-                status_code=400, 
-                detail="No FAISS index found. Please process some PDF documents first."
-            )
-        if not os.path.exists(SQLITE_DB_PATH):
-            raise HTTPException(
-                status_code=400, 
-                detail="No SQLite database found. Please process some PDF documents first."
-            )
+        check_storage_exists(storage.faiss_path, storage.db_path)
 
         docx_chunks = []
         if file and file.filename.endswith('.docx'):
             content = await file.read()
-            text = docx2txt.process(io.BytesIO(content))
-            chunks = chunker(docs=[text])
-            docx_chunks = [
-                {
-                    'text': chunk.content,
-                    'doc_name': file.filename,
-                    'page_range': 'N/A'
-                }
-                for chunk in chunks[0]
-            ]
+            docx_chunks = chunk_docx(content, file.filename)
 
-        base_context = get_relevant_context(
+        base_context = await asyncio.to_thread(
+            get_relevant_context,
             query=query,
-            faiss_path=FAISS_INDEX_PATH,
-            db_path=SQLITE_DB_PATH,
-            top_k=top_k
+            faiss_path=storage.faiss_path,
+            db_path=storage.db_path,
+            top_k=top_k,
+            tenant=storage.tenant_id
         )
 
         individual_results = []
+        cached_count = 0
+        prompt_tokens = 0
         if docx_chunks:
+            chunk_contexts = []
             for chunk in docx_chunks:
-                chunk_context = await get_hybrid_context(
+                chunk_contexts.append(await get_hybrid_context(
                     query=query,
                     chunk=chunk,
-                    faiss_path=FAISS_INDEX_PATH,
-                    db_path=SQLITE_DB_PATH,
-                    top_k=top_k
+                    faiss_path=storage.faiss_path,
+                    db_path=storage.db_path,
+                    top_k=top_k,
+                    tenant=storage.tenant_id
+                ))
+
+            if group_chunks:
+                groups = group_chunks_by_context(docx_chunks, chunk_contexts)
+            else:
+                groups = [([i], chunk_context) for i, chunk_context in enumerate(chunk_contexts)]
+
+            for chunk_indices, group_context in groups:
+                analyses = await process_chunk_group_with_openai(
+                    chunks=[docx_chunks[i] for i in chunk_indices],
+                    query=query,
+                    context_results={"results": group_context},
+                    client=client,
+                    db_path=storage.db_path,
+                    cache_path=storage.llm_cache_path
+                )
+
+                for analysis in analyses:
+                    if analysis['cached']:
+                        cached_count += 1
+                    prompt_tokens += analysis['prompt_tokens']
+
+                    individual_results.append({
+                        # "document": chunk['doc_name'],
+                        # "page_range": chunk['page_range'],
+                        "chunk_text": analysis['chunk']['text'],
+                        "analysis_result": analysis['analysis']
+                    })
+
+        response_data = {
+            "success": True,
+            "query": query,
+            "individual_results": individual_results,
+            "cache_info": {
+                "cached": cached_count,
+                "fresh": len(individual_results) - cached_count
+            },
+            "prompt_tokens": prompt_tokens,
+            "storage_info": {
+                "tenant_id": storage.tenant_id,
+                "faiss_index_path": storage.faiss_path,
+                "sqlite_db_path": storage.db_path
+            }
+        }
+        if include_timings:
+            response_data["timings"] = timings
+        return response_data
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/search/stream")
+async def stream_search_regulations(
+    query: str = Form(...),
+    top_k: int = Form(5),
+    file: UploadFile = File(...),
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Streaming variant of /search. Emits newline-delimited JSON events as the audit runs:
+    a "start" event with the chunk total, one "result" event per analyzed chunk followed
+    by a "progress" event (chunks done / total, tokens used), and a final "done" event.
+    Results are not accumulated server-side, so memory stays flat for large SOPs.
+    """
+    check_storage_exists(storage.faiss_path, storage.db_path)
+    if not file.filename.endswith('.docx'):
+        raise HTTPException(status_code=400, detail="File must be a DOCX")
+
+    content = await file.read()
+    filename = file.filename
+
+    async def event_stream():
+        try:
+            docx_chunks = await asyncio.to_thread(chunk_docx, content, filename)
+            total = len(docx_chunks)
+            yield json.dumps({"type": "start", "query": query, "total": total}) + "\n"
+
+            tokens_used = 0
+            prompt_tokens = 0
+            cached_count = 0
+            for index, chunk in enumerate(docx_chunks):
+                chunk_context = await asyncio.to_thread(
+                    get_relevant_context,
+                    query=f"{query} context: {chunk['text']}",
+                    faiss_path=storage.faiss_path,
+                    db_path=storage.db_path,
+                    top_k=top_k,
+                    tenant=storage.tenant_id
                 )
 
                 analysis = await process_chunk_with_openai(
                     chunk=chunk,
                     query=query,
-                    context_results={"results": chunk_context},
-                    client=client
+                    context_results={"results": chunk_context["results"]},
+                    client=client,
+                    db_path=storage.db_path,
+                    cache_path=storage.llm_cache_path
                 )
-
-                individual_results.append({
-                    # "document": chunk['doc_name'],
-                    # "page_range": chunk['page_range'],
+                tokens_used += analysis['tokens_used']
+                prompt_tokens += analysis['prompt_tokens']
+                if analysis['cached']:
+                    cached_count += 1
+
+                yield json.dumps({
+                    "type": "result",
+                    "index": index,
                     "chunk_text": chunk['text'],
-                    "analysis_result": analysis['analysis']
-                })
+                    "analysis_result": analysis['analysis'],
+                    "cached": analysis['cached']
+                }) + "\n"
+                yield json.dumps({
+                    "type": "progress",
+                    "done": index + 1,
+                    "total": total,
+                    "tokens_used": tokens_used,
+                    "prompt_tokens": prompt_tokens
+                }) + "\n"
+
+            yield json.dumps({
+                "type": "done",
+                "total": total,
+                "tokens_used": tokens_used,
+                "prompt_tokens": prompt_tokens,
+                "cache_info": {
+                    "cached": cached_count,
+                    "fresh": total - cached_count
+                }
+            }) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
 
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@router.delete("/cache")
+async def purge_analysis_cache(
+    template_version: str = Query(...),
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Remove the tenant's cached LLM analyses generated with the given prompt template version.
+    """
+    try:
+        purged = purge_cache(template_version, storage.llm_cache_path)
         return {
             "success": True,
-            "query": query,
-            "individual_results": individual_results,
-            "storage_info": {
-                "faiss_index_path": FAISS_INDEX_PATH,
-                "sqlite_db_path": SQLITE_DB_PATH
-            }
+            "template_version": template_version,
+            "purged": purged
         }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def run_batch_audit_in_background(job_id: str, storage: TenantStorage, concurrency: int,
+                                        requests_per_minute: int):
+    try:
+        await run_batch_audit(
+            job_id,
+            client=client,
+            faiss_path=storage.faiss_path,
+            db_path=storage.db_path,
+            concurrency=concurrency,
+            requests_per_minute=requests_per_minute,
+            job_root=storage.job_root,
+            cache_path=storage.llm_cache_path,
+            tenant=storage.tenant_id
+        )
+    except Exception as e:
+        # the failure is recorded in the job state; resuming retries the unfinished work
+        logging.error(f"Batch audit job {job_id} stopped: {str(e)}")
+
+@router.post("/batch")
+async def start_batch_audit(
+    background_tasks: BackgroundTasks,
+    query: str = Form(...),
+    top_k: int = Form(5),
+    files: List[UploadFile] = File(...),
+    concurrency: int = Form(BATCH_AUDIT_CONCURRENCY),
+    requests_per_minute: int = Form(BATCH_AUDIT_REQUESTS_PER_MINUTE),
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Start an offline audit of many SOPs against the regulatory corpus. The job runs in the
+    background; poll GET /batch/{job_id} for progress and fetch per-SOP reports when done.
+    """
+    check_storage_exists(storage.faiss_path, storage.db_path)
+    for file in files:
+        if not file.filename.endswith('.docx'):
+            raise HTTPException(status_code=400, detail=f"{file.filename} is not a DOCX")
 
+    try:
+        sop_files = [(file.filename, await file.read()) for file in files]
+        job = create_job(sop_files, query, top_k, storage.job_root)
+        background_tasks.add_task(
+            run_batch_audit_in_background, job["job_id"], storage, concurrency, requests_per_minute
+        )
+        return {"success": True, "job": job}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/batch/{job_id}")
+async def get_batch_audit(job_id: str, storage: TenantStorage = Depends(get_tenant_storage)):
+    """Return the state and progress of a batch audit job."""
+    job = load_job(job_id, storage.job_root)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch audit job {job_id} not found")
+    return {"success": True, "job": job}
+
+@router.post("/batch/{job_id}/resume")
+async def resume_batch_audit(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    concurrency: int = Form(BATCH_AUDIT_CONCURRENCY),
+    requests_per_minute: int = Form(BATCH_AUDIT_REQUESTS_PER_MINUTE),
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Resume a failed or interrupted batch audit job. Finished SOP reports and checkpointed
+    analyses are kept; only the remaining work is redone.
+    """
+    check_storage_exists(storage.faiss_path, storage.db_path)
+    job = load_job(job_id, storage.job_root)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch audit job {job_id} not found")
+    if job["status"] == "done":
+        return {"success": True, "job": job}
+    background_tasks.add_task(run_batch_audit_in_background, job_id, storage, concurrency, requests_per_minute)
+    return {"success": True, "job": job}
+
+@router.get("/batch/{job_id}/reports/{sop_name}")
+async def get_batch_audit_report(job_id: str, sop_name: str,
+                                 storage: TenantStorage = Depends(get_tenant_storage)):
+    """Return the audit report of one SOP in a batch audit job."""
+    if load_job(job_id, storage.job_root) is None:
+        raise HTTPException(status_code=404, detail=f"Batch audit job {job_id} not found")
+    path = report_path(job_id, os.path.basename(sop_name), storage.job_root)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"No report for {sop_name} in job {job_id}")
+    with open(path) as f:
+        return json.load(f)
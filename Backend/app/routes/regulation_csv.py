@@ -0,0 +1,204 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import JSONResponse
+import asyncio
+import logging
+import os
+from ..services.structured import iter_clause_rows, clause_chunks, batched, existing_source_ids
+from ..services.store import (
+    embed_chunks,
+    embed_chunk_sentences,
+    summarize_chunks,
+    persist_chunks,
+    create_metadata_db,
+    new_pending_index,
+    flush_pending_index,
+)
+from ..services.entity_relation import process_entity_relations
+from ..services.metrics import start_request_timings, increment
+from ..services.pipeline import StagedPipeline, Stage
+from ..services.tenants import TenantStorage, get_tenant_storage
+
+router = APIRouter()
+
+DB_DIR = "db"
+
+MAX_BATCH_SIZE = 5000
+
+if not os.path.exists(DB_DIR):
+    os.makedirs(DB_DIR)
+
+def build_clause_pipeline(storage, doc_name, clauses_per_chunk, summary_mode, embed_sentences, skip_existing,
+                          faiss_index, embed_workers, summarize_workers, queue_size):
+    """
+    Build the staged clause loader: group -> embed (-> summarize) -> store into the
+    given tenant storage. Each item is a batch of clauses; the group stage drops clauses
+    already stored (or seen earlier in this upload) when skip_existing is set and groups
+    the rest into chunks, so groups never span batches. The group and store stages are
+    single-threaded; the store stage adds vectors to the shared in-memory pending index.
+    """
+    seen_ids = set()
+
+    def group(batch):
+        clauses = batch.pop("clauses")
+        if skip_existing:
+            # Earlier batches may still be queued in later stages, so the database alone
+            # does not know about them yet.
+            new_ids = [clause["source_id"] for clause in clauses
+                       if clause["source_id"] and clause["source_id"] not in seen_ids]
+            stored = existing_source_ids(storage.db_path, doc_name, new_ids)
+            kept = []
+            for clause in clauses:
+                source_id = clause["source_id"]
+                if source_id and (source_id in stored or source_id in seen_ids):
+                    batch["skipped"] += 1
+                    continue
+                if source_id:
+                    seen_ids.add(source_id)
+                kept.append(clause)
+            clauses = kept
+        batch["chunks"] = list(clause_chunks(clauses, doc_name, clauses_per_chunk))
+        return batch
+
+    def embed(batch):
+        if batch["chunks"]:
+            batch["embeddings"] = embed_chunks(batch["chunks"])
+            batch["sentences"] = (
+                embed_chunk_sentences(batch["chunks"]) if embed_sentences
+                else [[] for _ in batch["chunks"]]
+            )
+        return batch
+
+    def summarize(batch):
+        if summary_mode == "bart":
+            batch["summaries"] = summarize_chunks(batch["chunks"])
+        else:
+            batch["summaries"] = [chunk["title"] or chunk["text"][:100] for chunk in batch["chunks"]]
+        return batch
+
+    def store(batch):
+        if batch["chunks"]:
+            persist_chunks(
+                batch["chunks"], batch.pop("embeddings"), batch.pop("summaries"), batch.pop("sentences"),
+                faiss_output_path=storage.faiss_path,
+                db_path=storage.db_path,
+                faiss_index=faiss_index
+            )
+        batch["stored"] = len(batch.pop("chunks"))
+        return batch
+
+    return StagedPipeline([
+        Stage("group", group, 1),
+        Stage("embed", embed, embed_workers),
+        Stage("summarize", summarize, summarize_workers if summary_mode == "bart" else 1),
+        Stage("store", store, 1),
+    ], queue_size=queue_size)
+
+@router.post("/process-clauses")
+async def process_clauses(
+    file: UploadFile = File(...),
+    doc_name: str = None,
+    id_field: str = "id",
+    title_field: str = "title",
+    text_field: str = "text",
+    clauses_per_chunk: int = 1,
+    batch_size: int = 1000,
+    summary_mode: str = "title",
+    embed_sentences: bool = True,
+    skip_existing: bool = True,
+    process_entities: bool = True,
+    embed_workers: int = 1,
+    summarize_workers: int = 2,
+    queue_size: int = 2,
+    include_timings: bool = False,
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Bulk-load structured regulations from a CSV or JSONL export (clause id, title, text)
+    straight into the chunk store, vector index and graph, skipping PDF layout parsing
+    and statistical chunking. Rows are streamed in batches of batch_size, so memory stays
+    bounded by the pipeline queues regardless of file size.
+
+    Each clause becomes a chunk carrying its native id (source_id); with clauses_per_chunk > 1
+    consecutive clauses of a batch are grouped. summary_mode "title" uses the clause title as
+    the chunk summary, "bart" runs the summarizer. With skip_existing, clauses already stored
+    for the same doc_name (under any grouping) or repeated within the upload are not loaded
+    again. Rows without text and JSONL lines that are not JSON objects are
+    skipped and counted in rows_skipped. Clauses go to the tenant named by the X-Tenant-ID header.
+    """
+    timings = start_request_timings()
+    filename = file.filename
+    if filename.endswith('.csv'):
+        file_format = "csv"
+    elif filename.endswith('.jsonl') or filename.endswith('.ndjson'):
+        file_format = "jsonl"
+    else:
+        raise HTTPException(status_code=400, detail="File must be a CSV or JSONL export")
+    if summary_mode not in ("title", "bart"):
+        raise HTTPException(status_code=400, detail="summary_mode must be 'title' or 'bart'")
+    if clauses_per_chunk < 1 or not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"clauses_per_chunk must be >= 1 and batch_size between 1 and {MAX_BATCH_SIZE}"
+        )
+    doc_name = doc_name or filename
+
+    def run():
+        faiss_index = new_pending_index()
+        if skip_existing:
+            # Adds the per-clause id table to databases created before it existed.
+            create_metadata_db(storage.db_path)
+        pipeline = build_clause_pipeline(
+            storage, doc_name, clauses_per_chunk, summary_mode, embed_sentences, skip_existing,
+            faiss_index, embed_workers, summarize_workers, queue_size
+        )
+        rows_skipped = {}
+        clauses = iter_clause_rows(file.file, file_format, id_field, title_field, text_field, rows_skipped)
+        stored = 0
+        skipped = 0
+        errors = []
+        try:
+            for item in pipeline.run((i, {"clauses": batch, "skipped": 0})
+                                     for i, batch in enumerate(batched(clauses, batch_size))):
+                if item.error is not None:
+                    errors.append({"batch": item.key, "stage": item.failed_stage, "error": item.error})
+                    continue
+                stored += item.payload["stored"]
+                skipped += item.payload["skipped"]
+        finally:
+            # Rows of finished batches are committed to SQLite; keep the index in step with them.
+            flush_pending_index(faiss_index, storage.faiss_path, storage.db_path)
+        increment("clauses_skipped_total", skipped)
+        logging.info(f"Loaded {stored} chunks from {filename} ({skipped} clauses skipped, {len(errors)} failed batches)")
+
+        entity_processing = None
+        if process_entities and stored:
+            entity_processing = process_entity_relations(storage.db_path, storage.tenant_id)
+        return stored, skipped, rows_skipped, errors, entity_processing, pipeline.stats
+
+    try:
+        stored, skipped, rows_skipped, errors, entity_processing, stages = await asyncio.to_thread(run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        file.file.close()
+
+    response_data = {
+        "success": not errors,
+        "message": f"Loaded {stored} chunks from {filename}",
+        "doc_name": doc_name,
+        "storage_info": {
+            "tenant_id": storage.tenant_id,
+            "faiss_index_path": storage.faiss_path,
+            "sqlite_db_path": storage.db_path
+        },
+        "chunks_stored": stored,
+        "clauses_skipped": skipped,
+        "rows_skipped": rows_skipped,
+        "failed_batches": errors,
+        "stages": stages
+    }
+    if entity_processing is not None:
+        response_data["entity_processing"] = entity_processing
+    if include_timings:
+        response_data["timings"] = timings
+    return JSONResponse(content=response_data)
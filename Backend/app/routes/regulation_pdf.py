@@ -1,11 +1,33 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi.responses import JSONResponse
+from typing import List
+import asyncio
 import os
 import shutil
-from ..services.parse import extract_pdf_text
-from ..services.preprocess import preprocess_documents
-from ..services.store import store_chunks_in_vector_db
-from ..services.entity_relation import process_entity_relations
+import zipfile
+from ..services.parse import extract_pdf_text, iter_pdf_pages
+from ..services.preprocess import preprocess_documents, iter_windowed_chunks
+from ..services.config import CHUNK_WINDOW_PAGES
+from ..services.store import (
+    store_chunks_in_vector_db,
+    embed_chunks,
+    embed_chunk_sentences,
+    summarize_chunks,
+    persist_chunks,
+    store_chunk_stream,
+)
+from ..services.entity_relation import (
+    process_entity_relations,
+    rebuild_knn_graph,
+    relink_chunks,
+    CONFIDENCE_THRESHOLD,
+    KNN_NEIGHBORS,
+)
+from ..services.metrics import start_request_timings
+from ..services.shards import reshard, index_exists
+from ..services.index_cache import index_cache
+from ..services.tenants import TenantStorage, get_tenant_storage
+from ..services.pipeline import StagedPipeline, Stage
 
 router = APIRouter()
 
@@ -19,22 +41,29 @@ for directory in [UPLOAD_DIR, DB_DIR]:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-FAISS_INDEX_PATH = os.path.join(DB_DIR, "regulatory_index.faiss")
-SQLITE_DB_PATH = os.path.join(DB_DIR, "chunks.db")
-
 @router.post("/process-pdf")
 async def process_pdf(
     file: UploadFile = File(...),
     zone_threshold: int = 15,
     horizontal_threshold_ratio: float = 0.2,
     reg_overlap_sentences: int = 1,
-    process_entities: bool = True
+    process_entities: bool = True,
+    include_timings: bool = False,
+    streaming: bool = False,
+    window_pages: int = CHUNK_WINDOW_PAGES,
+    storage: TenantStorage = Depends(get_tenant_storage)
 ):
     """
     Process uploaded PDF through text extraction, chunking pipeline, store in vector database,
     and optionally process entity relations.
     Returns the processed chunks, storage locations, and entity processing results if requested.
+    With include_timings, the response carries a per-stage timing breakdown.
+    With streaming, pages are extracted, chunked in windows of window_pages pages and stored
+    window by window, keeping memory flat for very large documents; only the chunk count
+    is returned.
+    The document is stored in the corpus of the tenant named by the X-Tenant-ID header.
     """
+    timings = start_request_timings()
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
@@ -44,43 +73,63 @@ async def process_pdf(
         with open(pdf_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        extracted_text = extract_pdf_text(pdf_path, zone_threshold=zone_threshold, horizontal_threshold_ratio=horizontal_threshold_ratio)
-        
-        regulatory_chunks = preprocess_documents(
-            regulatory_text=extracted_text,
-            reg_overlap_sentences=reg_overlap_sentences,
-            MIN_tokens=REG_MIN_tokens,
-            MAX_tokens=REG_MAX_tokens
-        )
-        
-        chunks_with_ids = store_chunks_in_vector_db(
-            regulatory_chunks=regulatory_chunks,
-            faiss_output_path=FAISS_INDEX_PATH,
-            db_path=SQLITE_DB_PATH
-        )
+        if streaming:
+            pages = iter_pdf_pages(pdf_path, zone_threshold=zone_threshold, horizontal_threshold_ratio=horizontal_threshold_ratio)
+            chunk_count = store_chunk_stream(
+                iter_windowed_chunks(
+                    pages,
+                    MIN_tokens=REG_MIN_tokens,
+                    MAX_tokens=REG_MAX_tokens,
+                    reg_overlap_sentences=reg_overlap_sentences,
+                    window_pages=window_pages
+                ),
+                faiss_output_path=storage.faiss_path,
+                db_path=storage.db_path
+            )
+            chunks = {"chunk_count": chunk_count}
+        else:
+            extracted_text = extract_pdf_text(pdf_path, zone_threshold=zone_threshold, horizontal_threshold_ratio=horizontal_threshold_ratio)
+            
+            regulatory_chunks = preprocess_documents(
+                regulatory_text=extracted_text,
+                reg_overlap_sentences=reg_overlap_sentences,
+                MIN_tokens=REG_MIN_tokens,
+                MAX_tokens=REG_MAX_tokens
+            )
+            
+            chunks_with_ids = store_chunks_in_vector_db(
+                regulatory_chunks=regulatory_chunks,
+                faiss_output_path=storage.faiss_path,
+                db_path=storage.db_path
+            )
+            chunks = {
+                "regulatory_chunks": chunks_with_ids,
+                "chunk_count": len(chunks_with_ids)
+            }
         
         response_data = {
             "success": True,
             "message": "PDF processed, chunked, and stored successfully",
             "pdf_path": pdf_path,
             "storage_info": {
-                "faiss_index_path": FAISS_INDEX_PATH,
-                "sqlite_db_path": SQLITE_DB_PATH
+                "tenant_id": storage.tenant_id,
+                "faiss_index_path": storage.faiss_path,
+                "sqlite_db_path": storage.db_path
             },
-            "chunks": {
-                "regulatory_chunks": chunks_with_ids,
-                "chunk_count": len(chunks_with_ids)
-            }
+            "chunks": chunks
         }
         
         if process_entities:
-            entity_results = process_entity_relations(SQLITE_DB_PATH)
+            entity_results = process_entity_relations(storage.db_path, storage.tenant_id)
             response_data["entity_processing"] = entity_results
             if entity_results.get("message") == "No new chunks to process":
                 response_data["message"] = "PDF processed, chunked, and stored successfully. No new chunks needed entity processing."
             else:
                 response_data["message"] = "PDF processed, chunked, stored, and entity relations extracted successfully"
         
+        if include_timings:
+            response_data["timings"] = timings
+        
         return JSONResponse(content=response_data)
         
     except Exception as e:
@@ -89,3 +138,216 @@ async def process_pdf(
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         file.file.close()
+
+def save_batch_uploads(files):
+    """
+    Save uploaded PDFs (and the PDFs inside uploaded zip archives) to UPLOAD_DIR.
+    PDFs are saved under their base name, which is also their doc_name, so two PDFs
+    with the same name anywhere in the upload are rejected.
+    Returns (filename, path) pairs.
+    """
+    saved = []
+
+    def save(filename, source):
+        filename = os.path.basename(filename)
+        if any(name == filename for name, _ in saved):
+            raise HTTPException(status_code=400, detail=f"Duplicate PDF filename in upload: {filename}")
+        pdf_path = os.path.join(UPLOAD_DIR, filename)
+        with open(pdf_path, "wb") as buffer:
+            shutil.copyfileobj(source, buffer)
+        saved.append((filename, pdf_path))
+
+    try:
+        for file in files:
+            try:
+                if file.filename.endswith('.zip'):
+                    with zipfile.ZipFile(file.file) as archive:
+                        for member in archive.infolist():
+                            if member.is_dir() or not member.filename.endswith('.pdf'):
+                                continue
+                            with archive.open(member) as source:
+                                save(member.filename, source)
+                elif file.filename.endswith('.pdf'):
+                    save(file.filename, file.file)
+                else:
+                    raise HTTPException(status_code=400, detail=f"{file.filename} is not a PDF or zip file")
+            finally:
+                file.file.close()
+    except Exception:
+        for _, pdf_path in saved:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+        raise
+    return saved
+
+def build_ingest_pipeline(storage, zone_threshold, horizontal_threshold_ratio, reg_overlap_sentences,
+                          process_entities, extract_workers, chunk_workers, embed_workers,
+                          summarize_workers, queue_size):
+    """
+    Build the staged ingest pipeline: extract -> chunk -> embed -> summarize -> store (-> graph)
+    into the given tenant storage. Storage and graph stages run single-threaded since they
+    write to shared databases.
+    """
+    def extract(doc):
+        doc["text"] = extract_pdf_text(
+            doc["pdf_path"],
+            zone_threshold=zone_threshold,
+            horizontal_threshold_ratio=horizontal_threshold_ratio
+        )
+        return doc
+
+    def chunk(doc):
+        doc["chunks"] = preprocess_documents(
+            regulatory_text=doc.pop("text"),
+            reg_overlap_sentences=reg_overlap_sentences,
+            MIN_tokens=REG_MIN_tokens,
+            MAX_tokens=REG_MAX_tokens,
+            doc_name=doc["filename"]
+        )
+        return doc
+
+    def embed(doc):
+        doc["embeddings"] = embed_chunks(doc["chunks"])
+        doc["sentences"] = embed_chunk_sentences(doc["chunks"])
+        return doc
+
+    def summarize(doc):
+        doc["summaries"] = summarize_chunks(doc["chunks"])
+        return doc
+
+    def store(doc):
+        persist_chunks(
+            doc["chunks"], doc.pop("embeddings"), doc.pop("summaries"), doc.pop("sentences"),
+            faiss_output_path=storage.faiss_path,
+            db_path=storage.db_path
+        )
+        return doc
+
+    def graph(doc):
+        doc["entity_processing"] = process_entity_relations(storage.db_path, storage.tenant_id)
+        return doc
+
+    stages = [
+        Stage("extract", extract, extract_workers),
+        Stage("chunk", chunk, chunk_workers),
+        Stage("embed", embed, embed_workers),
+        Stage("summarize", summarize, summarize_workers),
+        Stage("store", store, 1),
+    ]
+    if process_entities:
+        stages.append(Stage("graph", graph, 1))
+    return StagedPipeline(stages, queue_size=queue_size)
+
+@router.post("/process-pdfs")
+async def process_pdf_batch(
+    files: List[UploadFile] = File(...),
+    zone_threshold: int = 15,
+    horizontal_threshold_ratio: float = 0.2,
+    reg_overlap_sentences: int = 1,
+    process_entities: bool = True,
+    extract_workers: int = 2,
+    chunk_workers: int = 2,
+    embed_workers: int = 1,
+    summarize_workers: int = 2,
+    queue_size: int = 4,
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Ingest many PDFs (or zip archives of PDFs) through a pipelined executor.
+    Each stage has its own worker count and bounded input queue, so documents overlap
+    across stages and throughput is limited by the slowest stage.
+    Returns per-document results and per-stage utilization.
+    """
+    saved = save_batch_uploads(files)
+    if not saved:
+        raise HTTPException(status_code=400, detail="No PDF files found in the upload")
+
+    pipeline = build_ingest_pipeline(
+        storage, zone_threshold, horizontal_threshold_ratio, reg_overlap_sentences, process_entities,
+        extract_workers, chunk_workers, embed_workers, summarize_workers, queue_size
+    )
+
+    def run():
+        documents = []
+        for item in pipeline.run((filename, {"filename": filename, "pdf_path": pdf_path})
+                                 for filename, pdf_path in saved):
+            doc = item.payload
+            result = {
+                "filename": item.key,
+                "pdf_path": doc["pdf_path"],
+                "success": item.error is None,
+            }
+            if item.error is None:
+                result["chunk_count"] = len(doc["chunks"])
+                if "entity_processing" in doc:
+                    result["entity_processing"] = doc["entity_processing"]
+            else:
+                result["error"] = item.error
+                result["failed_stage"] = item.failed_stage
+                if os.path.exists(doc["pdf_path"]):
+                    os.remove(doc["pdf_path"])
+            documents.append(result)
+        return documents
+
+    try:
+        documents = await asyncio.to_thread(run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    succeeded = sum(1 for doc in documents if doc["success"])
+    return JSONResponse(content={
+        "success": succeeded == len(documents),
+        "message": f"Processed {succeeded}/{len(documents)} PDFs",
+        "storage_info": {
+            "tenant_id": storage.tenant_id,
+            "faiss_index_path": storage.faiss_path,
+            "sqlite_db_path": storage.db_path
+        },
+        "documents": documents,
+        "total_chunks": sum(doc.get("chunk_count", 0) for doc in documents),
+        "stages": pipeline.stats
+    })
+
+@router.post("/relink")
+async def relink_graph(
+    threshold: float = CONFIDENCE_THRESHOLD,
+    rebuild: bool = False,
+    k: int = KNN_NEIGHBORS,
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Re-create chunk-to-chunk links in the graph from the persisted k-NN graph using a new
+    confidence threshold. With rebuild, the k-NN index and neighbour table are first
+    rebuilt from the stored summary embeddings (e.g. to change k). Nothing is re-encoded.
+    """
+    if not os.path.exists(storage.db_path):
+        raise HTTPException(status_code=400, detail="No SQLite database found. Please process some PDF documents first.")
+    try:
+        response_data = {"success": True}
+        if rebuild:
+            response_data["knn_graph"] = await asyncio.to_thread(rebuild_knn_graph, storage.db_path, k)
+        response_data["links"] = await asyncio.to_thread(
+            relink_chunks, storage.db_path, threshold, storage.tenant_id
+        )
+        return JSONResponse(content=response_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/reshard")
+async def reshard_index(num_shards: int, storage: TenantStorage = Depends(get_tenant_storage)):
+    """
+    Partition the vector index into num_shards shards by rendezvous hashing of chunk_id,
+    or change the shard count of an already sharded index. Each shard is searched by its
+    own worker process. Only vectors whose shard changes are moved; nothing is re-encoded.
+    """
+    if not index_exists(storage.faiss_path):
+        raise HTTPException(status_code=400, detail="No FAISS index found. Please process some PDF documents first.")
+    if num_shards < 1:
+        raise HTTPException(status_code=400, detail="num_shards must be at least 1")
+    try:
+        result = await asyncio.to_thread(reshard, storage.faiss_path, num_shards)
+        # release the old layout's shard workers now rather than on the next search
+        index_cache.evict(storage.faiss_path)
+        return JSONResponse(content={"success": True, **result})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,184 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+import asyncio
+import io
+import logging
+import docx2txt
+from . import audit
+from ..services.analysis import process_chunk_with_openai
+from ..services.metrics import increment
+from ..services.preprocess import chunk_sop_text
+from ..services.sop_store import (
+    get_or_create_sop, sop_exists, list_sops, list_versions, get_version, add_version,
+    load_version_chunks, load_previous_hashes, find_reusable_results, store_audit_results,
+    corpus_fingerprint
+)
+from ..services.tenants import TenantStorage, get_tenant_storage
+
+router = APIRouter()
+
+def store_sop_version(sop_id, content: bytes, filename: str, db_path: str):
+    """
+    Extract and chunk an uploaded DOCX and store it as the next version of the SOP.
+
+    Returns:
+        tuple: (version_id, version)
+    """
+    text = docx2txt.process(io.BytesIO(content))
+    chunks = chunk_sop_text(text, filename)
+    return add_version(sop_id, filename, text, chunks, db_path=db_path)
+
+@router.get("/")
+async def get_sops(storage: TenantStorage = Depends(get_tenant_storage)):
+    """List the SOPs in the tenant's library."""
+    return {"success": True, "sops": list_sops(storage.sop_db_path)}
+
+@router.get("/{sop_id}/versions")
+async def get_sop_versions(sop_id: int, storage: TenantStorage = Depends(get_tenant_storage)):
+    """List the stored versions of an SOP."""
+    versions = list_versions(sop_id, storage.sop_db_path)
+    if not versions:
+        raise HTTPException(status_code=404, detail=f"SOP {sop_id} not found")
+    return {"success": True, "sop_id": sop_id, "versions": versions}
+
+@router.post("/upload")
+async def upload_sop(
+    name: str = Form(...),
+    file: UploadFile = File(...),
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Store a DOCX as a new version of the named SOP, creating the SOP on first upload.
+    """
+    if not file.filename.endswith('.docx'):
+        raise HTTPException(status_code=400, detail="File must be a DOCX")
+    try:
+        content = await file.read()
+        sop_id = get_or_create_sop(name, storage.sop_db_path)
+        version_id, version = await asyncio.to_thread(
+            store_sop_version, sop_id, content, file.filename, storage.sop_db_path
+        )
+        return {
+            "success": True,
+            "sop_id": sop_id,
+            "name": name,
+            "version": version,
+            "chunk_count": len(load_version_chunks(version_id, storage.sop_db_path))
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{sop_id}/audit")
+async def audit_sop(
+    sop_id: int,
+    query: str = Form(...),
+    top_k: int = Form(5),
+    version: int = Form(None),
+    file: UploadFile = File(None),
+    storage: TenantStorage = Depends(get_tenant_storage)
+):
+    """
+    Audit a stored SOP version against the regulatory corpus. Uploading a file first stores
+    it as a new version. Chunks whose content was already audited for the same query, top_k
+    and corpus state (in any version of this SOP) reuse their stored result; only changed
+    chunks are re-retrieved and re-analyzed. Chunks whose analysis failed are returned with
+    error set but not stored, so the next audit retries them.
+    """
+    audit.check_storage_exists(storage.faiss_path, storage.db_path)
+    if file and not file.filename.endswith('.docx'):
+        raise HTTPException(status_code=400, detail="File must be a DOCX")
+    if not sop_exists(sop_id, storage.sop_db_path):
+        raise HTTPException(status_code=404, detail=f"SOP {sop_id} not found")
+
+    try:
+        if file:
+            content = await file.read()
+            version_id, version = await asyncio.to_thread(
+                store_sop_version, sop_id, content, file.filename, storage.sop_db_path
+            )
+        else:
+            row = get_version(sop_id, version, storage.sop_db_path)
+            if row is None:
+                raise HTTPException(status_code=404, detail=f"SOP {sop_id} version {version or 'latest'} not found")
+            version_id, version = row
+
+        chunks = load_version_chunks(version_id, storage.sop_db_path)
+        fingerprint = corpus_fingerprint(storage.db_path)
+        reusable = find_reusable_results(sop_id, query, top_k, fingerprint, storage.sop_db_path)
+        previous_hashes = load_previous_hashes(sop_id, version, storage.sop_db_path)
+        current_hashes = {chunk["content_hash"] for chunk in chunks}
+
+        fresh = {}
+        failed = {}
+        for chunk in chunks:
+            chunk_hash = chunk["content_hash"]
+            if chunk_hash in reusable or chunk_hash in fresh or chunk_hash in failed:
+                continue
+            chunk_context = await asyncio.to_thread(
+                audit.get_relevant_context,
+                query=f"{query} context: {chunk['text']}",
+                faiss_path=storage.faiss_path,
+                db_path=storage.db_path,
+                top_k=top_k,
+                tenant=storage.tenant_id
+            )
+            analysis = await process_chunk_with_openai(
+                chunk=chunk,
+                query=query,
+                context_results={"results": chunk_context["results"]},
+                client=audit.client,
+                db_path=storage.db_path,
+                cache_path=storage.llm_cache_path
+            )
+            result = {"analysis": analysis["analysis"], "context": analysis["context"]}
+            if analysis["error"]:
+                failed[chunk_hash] = result
+            else:
+                fresh[chunk_hash] = result
+
+        results = []
+        individual_results = []
+        for chunk in chunks:
+            chunk_hash = chunk["content_hash"]
+            stored = reusable.get(chunk_hash) or fresh.get(chunk_hash) or failed[chunk_hash]
+            if chunk_hash not in failed:
+                results.append({
+                    "position": chunk["position"],
+                    "content_hash": chunk_hash,
+                    "analysis": stored["analysis"],
+                    "context": stored["context"]
+                })
+            individual_results.append({
+                "chunk_text": chunk["text"],
+                "analysis_result": stored["analysis"],
+                "reused": chunk_hash in reusable,
+                "changed": chunk_hash not in previous_hashes,
+                "error": chunk_hash in failed
+            })
+        store_audit_results(version_id, query, top_k, fingerprint, results, storage.sop_db_path)
+
+        reused_count = sum(1 for r in individual_results if r["reused"])
+        increment("sop_chunks_reused_total", reused_count, kind="analysis")
+        logging.info(f"Audited SOP {sop_id} v{version}: {len(fresh)} chunks analyzed, {reused_count} reused, "
+                     f"{len(failed)} failed")
+
+        return {
+            "success": not failed,
+            "sop_id": sop_id,
+            "version": version,
+            "query": query,
+            "individual_results": individual_results,
+            "diff": {
+                "unchanged": len(current_hashes & previous_hashes),
+                "changed": len(current_hashes - previous_hashes),
+                "removed": len(previous_hashes - current_hashes)
+            },
+            "reuse_info": {
+                "reused": reused_count,
+                "analyzed": len(fresh),
+                "failed": len(failed)
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
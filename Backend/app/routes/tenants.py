@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+from typing import List
+import asyncio
+from ..services.tenants import list_tenants, warm_up, TENANT_ID_PATTERN
+from ..services.index_cache import index_cache
+
+router = APIRouter()
+
+@router.get("/")
+async def get_tenants():
+    """List the tenants that have a corpus on this server."""
+    return {"success": True, "tenants": list_tenants()}
+
+@router.get("/cache")
+async def get_index_cache():
+    """Show the indexes currently held in the index cache, most recently used first."""
+    return {"success": True, **index_cache.stats()}
+
+@router.post("/warm")
+async def warm_tenants(tenant_ids: List[str]):
+    """
+    Load the vector indexes of the given tenants into the index cache, so their first
+    searches do not pay the index load.
+    """
+    invalid = [tenant_id for tenant_id in tenant_ids if not TENANT_ID_PATTERN.match(tenant_id)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid tenant ids: {', '.join(invalid)}")
+    results = await asyncio.to_thread(warm_up, tenant_ids)
+    return {"success": True, "tenants": results, "cache": index_cache.stats()}
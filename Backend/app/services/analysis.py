@@ -0,0 +1,142 @@
+from typing import Dict, List
+from openai import AsyncOpenAI
+from .llm_cache import make_cache_key, get_cached_analysis, store_analysis
+from .prompt import (
+    build_analysis_prompt,
+    count_tokens,
+    result_id,
+    split_group_analysis,
+    trim_context_to_budget,
+    GROUP_MARKER,
+)
+from .config import CONTEXT_TOKEN_BUDGET, LLM_CACHE_PATH
+from .metrics import span, increment
+
+LLM_MODEL = "gpt-4o-mini"
+PROMPT_TEMPLATE_VERSION = "v2"
+
+# Prefix of the analysis text returned in place of a failed LLM call.
+ANALYSIS_ERROR_PREFIX = "Error in OpenAI processing: "
+
+SYSTEM_PROMPT = "You are a compliance expert analyzing SOP documents against regulatory requirements. Identify issues using the exact format specified."
+
+def context_chunk_ids(context_results: Dict) -> list:
+    """Return the ordered ids of the regulatory chunks in a retrieval result."""
+    return [result_id(r) for r in context_results.get('results', [])]
+
+async def process_chunk_group_with_openai(
+    chunks: List[Dict],
+    query: str,
+    context_results: Dict,
+    client: AsyncOpenAI,
+    use_cache: bool = True,
+    db_path: str = None,
+    cache_path: str = LLM_CACHE_PATH
+) -> List[Dict]:
+    """
+    Analyze one SOP chunk, or a group of adjacent chunks sharing their retrieved
+    context, in a single OpenAI call. Returns one result per chunk.
+
+    The regulatory context is trimmed to CONTEXT_TOKEN_BUDGET tokens before the prompt
+    is assembled. Analyses are cached on disk keyed by model, prompt template version,
+    SOP text and the ordered ids of the retrieved context, so unchanged chunks are not resent.
+    A failed OpenAI call does not raise: its results carry the error text as the analysis
+    and "error": True. Each tenant passes its own cache_path, since chunk ids are only unique within a corpus.
+    """
+    if len(chunks) == 1:
+        sop_text = chunks[0]['text']
+    else:
+        sop_text = "\n".join(
+            f"{GROUP_MARKER.format(i + 1)}\n{chunk['text']}" for i, chunk in enumerate(chunks)
+        )
+
+    cache_key = make_cache_key(
+        LLM_MODEL,
+        PROMPT_TEMPLATE_VERSION,
+        sop_text,
+        context_chunk_ids(context_results) + [f"budget:{CONTEXT_TOKEN_BUDGET}"]
+    )
+
+    def build_results(analysis, cached, tokens_used, prompt_tokens, error=False):
+        return [
+            {
+                "chunk": chunk,
+                "analysis": chunk_analysis,
+                "context": context_results,
+                "score": chunk.get('score', 0),
+                "cached": cached,
+                "error": error,
+                "tokens_used": tokens_used if i == 0 else 0,
+                "prompt_tokens": prompt_tokens if i == 0 else 0
+            }
+            for i, (chunk, chunk_analysis) in enumerate(
+                zip(chunks, split_group_analysis(analysis, len(chunks)))
+            )
+        ]
+
+    if use_cache:
+        cached_analysis = get_cached_analysis(cache_key, cache_path)
+        if cached_analysis is not None:
+            increment("llm_cache_hits_total")
+            return build_results(cached_analysis, True, 0, 0)
+        increment("llm_cache_misses_total")
+
+    with span("prompt_build"):
+        trimmed_results = trim_context_to_budget(
+            sop_text,
+            context_results.get('results', []),
+            LLM_MODEL,
+            db_path=db_path
+        )
+    prompt = build_analysis_prompt(chunks, {"results": trimmed_results})
+    prompt_tokens = count_tokens(SYSTEM_PROMPT, LLM_MODEL) + count_tokens(prompt, LLM_MODEL)
+
+    try:
+        with span("openai_chat"):
+            response = await client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,
+                max_tokens=1000 * len(chunks)
+            )
+
+        analysis = response.choices[0].message.content
+        tokens_used = response.usage.total_tokens if response.usage else 0
+        increment("llm_calls_total")
+        if response.usage:
+            increment("llm_tokens_total", response.usage.prompt_tokens, kind="prompt")
+            increment("llm_tokens_total", response.usage.completion_tokens, kind="completion")
+        if use_cache:
+            store_analysis(cache_key, LLM_MODEL, PROMPT_TEMPLATE_VERSION, analysis, cache_path)
+
+        return build_results(analysis, False, tokens_used, prompt_tokens)
+    except Exception as e:
+        increment("llm_errors_total")
+        return build_results(f"{ANALYSIS_ERROR_PREFIX}{str(e)}", False, 0, prompt_tokens, error=True)
+
+async def process_chunk_with_openai(
+    chunk: Dict,
+    query: str,
+    context_results: Dict,
+    client: AsyncOpenAI,
+    use_cache: bool = True,
+    db_path: str = None,
+    cache_path: str = LLM_CACHE_PATH
+) -> Dict:
+    """
+    Process a single chunk with OpenAI, incorporating hybrid retrieval results.
+    Returns structured analysis identifying errors with citations.
+    """
+    results = await process_chunk_group_with_openai(
+        chunks=[chunk],
+        query=query,
+        context_results=context_results,
+        client=client,
+        use_cache=use_cache,
+        db_path=db_path,
+        cache_path=cache_path
+    )
+    return results[0]
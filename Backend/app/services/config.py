@@ -4,3 +4,51 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "your_default_anthropic_api_k
 NEO4J_URI = "neo4j://localhost:7687"
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "mypassword123")
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "db/llm_cache.db")
+SOP_DB_PATH = os.getenv("SOP_DB_PATH", "db/sops.db")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Inference backend for MiniLM embeddings and BART summaries: "torch" or "onnx"
+# ("onnx" needs the optional packages in requirements-onnx.txt).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "db/onnx")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes")
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+# Retrieval mode: "full" runs vector, lexical and graph legs; "fast" skips spaCy NER and the
+# graph hop; "auto" skips them only when the vector and lexical legs already agree confidently.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "full")
+FAST_PATH_MIN_SIMILARITY = float(os.getenv("FAST_PATH_MIN_SIMILARITY", "0.6"))
+
+# Offline batch audit jobs: job state and per-SOP reports are written under AUDIT_JOB_DIR.
+AUDIT_JOB_DIR = os.getenv("AUDIT_JOB_DIR", "db/audit_jobs")
+BATCH_AUDIT_CONCURRENCY = int(os.getenv("BATCH_AUDIT_CONCURRENCY", "8"))
+BATCH_AUDIT_REQUESTS_PER_MINUTE = int(os.getenv("BATCH_AUDIT_REQUESTS_PER_MINUTE", "500"))
+
+# PDF layout engine: "vectorized" (NumPy over the lightweight "blocks" extraction) or
+# "reference" (original per-block Python loops over the full "dict" extraction). Both
+# produce the same blocks in the same order; the reference engine also puts a space
+# between the spans of a line.
+LAYOUT_ENGINE = os.getenv("LAYOUT_ENGINE", "vectorized")
+
+# Sharded vector index: seconds to wait for a shard worker to answer a search.
+SHARD_SEARCH_TIMEOUT = float(os.getenv("SHARD_SEARCH_TIMEOUT", "30"))
+
+# Streaming ingestion: non-empty pages chunked per window by preprocess.iter_windowed_chunks.
+CHUNK_WINDOW_PAGES = int(os.getenv("CHUNK_WINDOW_PAGES", "20"))
+# Vectors collected before streaming ingestion appends them to the index on disk.
+STREAM_FLUSH_VECTORS = int(os.getenv("STREAM_FLUSH_VECTORS", "2000"))
+
+# Multi-tenancy: requests select a tenant with the X-Tenant-ID header. The default tenant keeps
+# the original db/ paths; other tenants get their own directory under TENANT_ROOT.
+TENANT_ROOT = os.getenv("TENANT_ROOT", "db/tenants")
+DEFAULT_TENANT_ID = os.getenv("DEFAULT_TENANT_ID", "default")
+# Memory budget of the LRU cache of loaded vector indexes, and tenants loaded at startup.
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_MB", "1024")) * 1024 * 1024
+WARM_TENANTS = [t.strip() for t in os.getenv("WARM_TENANTS", "").split(",") if t.strip()]
+
+# Embedding micro-batching: concurrent encode requests are merged into one forward pass of up
+# to EMBED_MAX_BATCH_SIZE texts, waiting at most EMBED_MAX_WAIT_MS for the batch to fill.
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
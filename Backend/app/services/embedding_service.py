@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+import numpy as np
+from .config import EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS
+from .inference import get_embedding_model
+from .metrics import observe, span
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+QUEUE_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class _Request:
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class EmbeddingService:
+    """
+    Micro-batching front end for the shared sentence encoder.
+
+    Small encode requests from any thread are queued and a single worker thread merges
+    them into one forward pass, flushing as soon as max_batch_size texts are queued or
+    the oldest request has waited max_wait_ms. Requests of max_batch_size texts or more
+    are already full batches; they are encoded in the caller's thread, one slice at a
+    time, so queued requests are flushed in between. Only one forward pass runs at a time.
+
+    encode() and get_sentence_embedding_dimension() match the SentenceTransformer calls
+    used in this app, so the service is a drop-in for the model.
+    """
+
+    def __init__(self, model, max_batch_size=EMBED_MAX_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._model_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, sentences, batch_size=None, convert_to_numpy=True, **kwargs):
+        """
+        Encode one text or a list of texts. Blocks until the embeddings are ready.
+        batch_size only sets the slice size of requests encoded in the caller's thread;
+        numpy float32 arrays are always returned.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            embeddings = np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        elif len(texts) >= self.max_batch_size:
+            embeddings = self._encode_direct(texts, batch_size or self.max_batch_size)
+        else:
+            request = _Request(texts)
+            self._queue.put(request)
+            embeddings = request.future.result()
+        return embeddings[0] if single else embeddings
+
+    def _forward(self, texts):
+        with self._model_lock, span("embedding_forward"):
+            return np.asarray(
+                self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True), dtype=np.float32
+            )
+
+    def _encode_direct(self, texts, batch_size):
+        parts = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            observe("embedding_batch_size", len(batch), buckets=BATCH_SIZE_BUCKETS, path="direct")
+            parts.append(self._forward(batch))
+        return np.concatenate(parts)
+
+    def _collect(self):
+        """Block for the next request, then gather more until the batch is full or the oldest has waited max_wait."""
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = batch[0].enqueued_at + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for request in batch:
+                observe("embedding_queue_wait_seconds", started - request.enqueued_at, buckets=QUEUE_WAIT_BUCKETS)
+            texts = [text for request in batch for text in request.texts]
+            observe("embedding_batch_size", len(texts), buckets=BATCH_SIZE_BUCKETS, path="queued")
+            observe("embedding_batch_requests", len(batch), buckets=BATCH_SIZE_BUCKETS)
+            try:
+                embeddings = self._forward(texts)
+            except Exception as e:
+                logging.error(f"Embedding batch of {len(texts)} texts failed: {str(e)}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+@lru_cache(maxsize=None)
+def get_embedding_service():
+    """Shared micro-batching encoder over get_embedding_model()."""
+    return EmbeddingService(get_embedding_model())
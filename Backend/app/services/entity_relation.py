@@ -1,22 +1,33 @@
 import logging
+import os
 import sqlite3
+import faiss
+import numpy as np
 import spacy
 from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer, util
-import itertools
-from .config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from .config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, DEFAULT_TENANT_ID
+from .metrics import span, timed, increment
+from .embedding_service import get_embedding_service
 
 logging.basicConfig(level=logging.INFO)
 
 nlp = spacy.load("en_core_web_lg")
 
-sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
+sbert_model = get_embedding_service()
 
 CONFIDENCE_THRESHOLD = 0.8
+KNN_NEIGHBORS = 10
+# Neighbours are persisted down to this similarity so links can be re-thresholded without re-encoding.
+KNN_STORE_FLOOR = 0.5
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+_tenant_migration_done = False
 
 def extract_entities(chunk_text, chunk_id, doc_name):
     """Extract entities using spaCy."""
-    doc = nlp(chunk_text)
+    with span("spacy_ner"):
+        doc = nlp(chunk_text)
     return [
         {
             "entity": ent.text.strip().lower(),
@@ -26,104 +37,296 @@ def extract_entities(chunk_text, chunk_id, doc_name):
         } for ent in doc.ents
     ]
 
-def compute_confidence_score(summary1, summary2):
-    """Calculate semantic similarity between two summaries using SBERT."""
-    embeddings = sbert_model.encode([summary1, summary2], convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(embeddings[0], embeddings[1]).item()
-    return similarity
-
-def precompute_similarities(summaries):
-    """Precompute pairwise similarities between summaries."""
-    similarity_scores = {}
-    chunk_ids = list(summaries.keys())
-    total_comparisons = len(chunk_ids) * (len(chunk_ids) - 1) // 2
-    comparisons_done = 0
-
-    for (id1, id2) in itertools.combinations(chunk_ids, 2):
-        score = compute_confidence_score(summaries[id1], summaries[id2])
-        similarity_scores[(id1, id2)] = score
-        comparisons_done += 1
-        
-        if comparisons_done % 1000 == 0:
-            logging.info(f"Computed {comparisons_done}/{total_comparisons} similarity scores")
-
-    return similarity_scores
-
-def store_in_neo4j(entities, similarity_scores):
-    """Store entities and context-based links in Neo4j."""
+def summary_index_path(db_path):
+    """Path of the approximate k-NN index over summary embeddings, stored next to the chunk database."""
+    return os.path.join(os.path.dirname(db_path), "summary_index.faiss")
+
+def create_link_tables(conn):
+    """Create the tables holding summary embeddings, the k-NN graph and extracted entities."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS summary_embeddings (
+            chunk_id INTEGER PRIMARY KEY,
+            embedding BLOB NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_neighbors (
+            chunk_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (chunk_id, neighbor_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chunk_neighbors_score ON chunk_neighbors (score)
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_entities (
+            chunk_id INTEGER NOT NULL,
+            entity TEXT NOT NULL,
+            type TEXT NOT NULL,
+            doc_name TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chunk_entities_chunk_id ON chunk_entities (chunk_id)
+    """)
+    conn.commit()
+
+def new_summary_index(dimension):
+    index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    return faiss.IndexIDMap(index)
+
+def load_summary_index(conn, db_path):
+    """
+    Load the summary k-NN index, or build it from the stored summary embeddings.
+    Chunks processed before summary embeddings were stored are encoded once here.
+    """
+    index_path = summary_index_path(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT c.chunk_id, c.summary
+        FROM chunks c
+        LEFT JOIN summary_embeddings s ON s.chunk_id = c.chunk_id
+        WHERE s.chunk_id IS NULL AND c.chunk_id <= (
+            SELECT last_processed_chunk_id FROM processing_status WHERE process_name = 'entity_processing'
+        )
+    """)
+    missing = cursor.fetchall()
+    if missing:
+        logging.info(f"Encoding {len(missing)} previously processed summaries for the k-NN index")
+        store_summary_embeddings(conn, [chunk_id for chunk_id, _ in missing],
+                                 encode_summaries([summary for _, summary in missing]))
+
+    if os.path.exists(index_path) and not missing:
+        index = faiss.read_index(index_path)
+        faiss.downcast_index(index.index).hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    cursor.execute("SELECT chunk_id, embedding FROM summary_embeddings ORDER BY chunk_id")
+    rows = cursor.fetchall()
+    index = new_summary_index(sbert_model.get_sentence_embedding_dimension())
+    if rows:
+        index.add_with_ids(
+            np.stack([np.frombuffer(embedding, dtype=np.float32) for _, embedding in rows]),
+            np.array([chunk_id for chunk_id, _ in rows], dtype=np.int64)
+        )
+    return index
+
+def encode_summaries(summaries):
+    with span("sbert_similarity"):
+        return sbert_model.encode(
+            [summary or "" for summary in summaries], convert_to_numpy=True
+        ).astype(np.float32)
+
+def add_missing_to_index(index, chunk_ids, embeddings):
+    """Add embeddings to the summary index, skipping chunk ids it already holds."""
+    existing = set(faiss.vector_to_array(index.id_map).tolist())
+    keep = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in existing]
+    if keep:
+        index.add_with_ids(embeddings[keep], np.array([chunk_ids[i] for i in keep], dtype=np.int64))
+
+def store_summary_embeddings(conn, chunk_ids, embeddings):
+    conn.executemany(
+        "INSERT OR REPLACE INTO summary_embeddings (chunk_id, embedding) VALUES (?, ?)",
+        [(chunk_id, embedding.tobytes()) for chunk_id, embedding in zip(chunk_ids, embeddings)]
+    )
+    conn.commit()
+
+def find_neighbors(index, chunk_ids, embeddings, k=KNN_NEIGHBORS, floor=KNN_STORE_FLOOR):
+    """
+    Query the k-NN index for the nearest summaries of each chunk.
+
+    Returns:
+        dict: (smaller chunk_id, larger chunk_id) -> similarity, for pairs above floor.
+    """
+    if len(chunk_ids) == 0 or index.ntotal == 0:
+        return {}
+    with span("knn_search"):
+        scores, neighbors = index.search(embeddings, min(k + 1, index.ntotal))
+
+    pairs = {}
+    for chunk_id, row_scores, row_neighbors in zip(chunk_ids, scores, neighbors):
+        for score, neighbor_id in zip(row_scores, row_neighbors):
+            neighbor_id = int(neighbor_id)
+            if neighbor_id == -1 or neighbor_id == chunk_id or score < floor:
+                continue
+            pair = (min(chunk_id, neighbor_id), max(chunk_id, neighbor_id))
+            pairs[pair] = max(pairs.get(pair, float("-inf")), float(score))
+    return pairs
+
+def store_neighbors(conn, pairs):
+    conn.executemany("""
+        INSERT OR REPLACE INTO chunk_neighbors (chunk_id, neighbor_id, score)
+        VALUES (?, ?, ?)
+    """, [(a, b, score) for (a, b), score in pairs.items()])
+    conn.commit()
+
+def load_chunk_entities(conn, chunk_ids):
+    """
+    Return distinct entities per chunk. Chunks processed before entities were stored
+    are re-extracted with spaCy and stored.
+    """
+    chunk_ids = list(chunk_ids)
+    if not chunk_ids:
+        return {}
+    cursor = conn.cursor()
+    placeholders = ','.join('?' for _ in chunk_ids)
+    cursor.execute(f"""
+        SELECT DISTINCT chunk_id, entity, type, doc_name FROM chunk_entities
+        WHERE chunk_id IN ({placeholders})
+    """, chunk_ids)
+    entities = {}
+    for chunk_id, entity, type, doc_name in cursor.fetchall():
+        entities.setdefault(chunk_id, []).append(
+            {"entity": entity, "type": type, "chunk_id": chunk_id, "doc_name": doc_name}
+        )
+
+    missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in entities]
+    if missing:
+        cursor.execute(f"""
+            SELECT chunk_id, text, doc_name FROM chunks WHERE chunk_id IN ({','.join('?' for _ in missing)})
+        """, missing)
+        for chunk_id, text, doc_name in cursor.fetchall():
+            chunk_entities = extract_entities(text, chunk_id, doc_name)
+            store_chunk_entities(conn, chunk_entities)
+            entities[chunk_id] = distinct_entities(chunk_entities)
+    return entities
+
+def store_chunk_entities(conn, entities):
+    conn.executemany(
+        "INSERT INTO chunk_entities (chunk_id, entity, type, doc_name) VALUES (?, ?, ?, ?)",
+        [(e["chunk_id"], e["entity"], e["type"], e["doc_name"]) for e in entities]
+    )
+    conn.commit()
+
+def distinct_entities(entities):
+    seen = set()
+    distinct = []
+    for entity in entities:
+        key = (entity["entity"], entity["type"], entity["doc_name"])
+        if key not in seen:
+            seen.add(key)
+            distinct.append(entity)
+    return distinct
+
+def migrate_default_tenant(session):
+    """
+    Entities stored before tenants existed carry no tenant property; assign them to the
+    default tenant once per process so tenant-scoped MERGE and MATCH still find them.
+    """
+    global _tenant_migration_done
+    if _tenant_migration_done:
+        return
+    session.run("MATCH (e:Entity) WHERE e.tenant IS NULL SET e.tenant = $tenant", tenant=DEFAULT_TENANT_ID)
+    _tenant_migration_done = True
+
+@timed("neo4j_store")
+def store_in_neo4j(entities, chunk_entities, similarity_scores, tenant=DEFAULT_TENANT_ID):
+    """
+    Store entities and context-based links in Neo4j.
+
+    Args:
+        entities (list): Newly extracted entities to create or extend.
+        chunk_entities (dict): chunk_id -> distinct entities of that chunk.
+        similarity_scores (dict): (chunk_id, chunk_id) -> confidence for linked chunk pairs.
+        tenant (str): Tenant namespace of the entities; chunk ids are only unique within it.
+    """
     driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
 
     def add_entity(tx, entity):
         query = """
-        MERGE (e:Entity {name: $name, type: $type, doc_name: $doc_name})
-        SET e.chunk_ids = coalesce(e.chunk_ids, []) + $chunk_id
+        MERGE (e:Entity {name: $name, type: $type, doc_name: $doc_name, tenant: $tenant})
+        SET e.chunk_ids = CASE
+            WHEN $chunk_id IN coalesce(e.chunk_ids, []) THEN e.chunk_ids
+            ELSE coalesce(e.chunk_ids, []) + $chunk_id
+        END
         """
         tx.run(query, name=entity["entity"], type=entity["type"],
-               doc_name=entity["doc_name"], chunk_id=entity["chunk_id"])
+               doc_name=entity["doc_name"], chunk_id=entity["chunk_id"], tenant=tenant)
 
-    def add_relation(tx, entity1, entity2, confidence):
+    def add_relations(tx, links):
         query = """
-        MATCH (e1:Entity {name: $entity1, doc_name: $doc_name}),
-              (e2:Entity {name: $entity2, doc_name: $doc_name})
-        MERGE (e1)-[r:CONTEXT_LINK {confidence: $confidence}]->(e2)
+        UNWIND $links AS link
+        MATCH (e1:Entity {name: link.entity1, doc_name: link.doc_name1, tenant: $tenant}),
+              (e2:Entity {name: link.entity2, doc_name: link.doc_name2, tenant: $tenant})
+        MERGE (e1)-[r:CONTEXT_LINK {confidence: link.confidence}]->(e2)
         """
-        tx.run(query, entity1=entity1["entity"], entity2=entity2["entity"],
-               doc_name=entity1["doc_name"], confidence=confidence)
+        tx.run(query, links=links, tenant=tenant)
 
+    links_created = 0
     with driver.session() as session:
+        migrate_default_tenant(session)
         for i, entity in enumerate(entities):
             session.execute_write(add_entity, entity)
             if (i + 1) % 1000 == 0:
                 logging.info(f"Stored {i + 1}/{len(entities)} entities in Neo4j")
 
-        total_links = len(entities) * (len(entities) - 1) // 2
-        links_processed = 0
-
-        for i, ent1 in enumerate(entities):
-            for j, ent2 in enumerate(entities[i+1:], start=i+1):
-                links_processed += 1
-                if ent1["doc_name"] == ent2["doc_name"] and ent1["entity"] != ent2["entity"]:
-                    chunk_pair = tuple(sorted([ent1["chunk_id"], ent2["chunk_id"]]))
-                    if chunk_pair in similarity_scores:
-                        confidence = similarity_scores[chunk_pair]
-                        if confidence >= CONFIDENCE_THRESHOLD:
-                            session.execute_write(add_relation, ent1, ent2, confidence)
+        for pair_number, ((id1, id2), confidence) in enumerate(similarity_scores.items(), start=1):
+            links = [
+                {
+                    "entity1": ent1["entity"],
+                    "doc_name1": ent1["doc_name"],
+                    "entity2": ent2["entity"],
+                    "doc_name2": ent2["doc_name"],
+                    "confidence": confidence
+                }
+                for ent1 in chunk_entities.get(id1, [])
+                for ent2 in chunk_entities.get(id2, [])
+                if ent1["entity"] != ent2["entity"]
+            ]
+            if links:
+                session.execute_write(add_relations, links)
+                links_created += len(links)
 
-                if links_processed % 10000 == 0: 
-                    logging.info(f"Processed {links_processed}/{total_links} potential links")
+            if pair_number % 1000 == 0:
+                logging.info(f"Linked {pair_number}/{len(similarity_scores)} chunk pairs")
 
     driver.close()
+    increment("graph_links_created_total", links_created)
     logging.info("Completed storing entities and relationships in Neo4j")
+    return links_created
 
-def process_entity_relations(db_path):
+@timed("process_entity_relations")
+def process_entity_relations(db_path, tenant=DEFAULT_TENANT_ID):
     """
     Process entity relations from chunks stored in the provided SQLite database.
     Creates a knowledge graph in Neo4j with entities and their relationships.
     Only processes chunks that haven't been processed before.
-    
+
+    Each new chunk is linked to its nearest neighbours across the whole corpus using an
+    approximate k-NN (HNSW) index over summary embeddings, so linking cost grows with
+    the number of new chunks rather than with all pairs. The k-NN graph is persisted in
+    chunk_neighbors so links can be rebuilt or re-thresholded without re-encoding.
+
     Args:
         db_path (str): Path to the SQLite database containing chunks
+        tenant (str): Tenant the chunk database belongs to
     """
     logging.info("Starting entity relation processing pipeline")
     conn = sqlite3.connect(db_path)
+    create_link_tables(conn)
     cursor = conn.cursor()
 
     cursor.execute("""
-        SELECT last_processed_chunk_id 
-        FROM processing_status 
+        SELECT last_processed_chunk_id
+        FROM processing_status
         WHERE process_name = 'entity_processing'
     """)
     result = cursor.fetchone()
     last_processed_id = result[0] if result else 0
-    
+
     cursor.execute("""
-        SELECT chunk_id, text, summary, doc_name 
-        FROM chunks 
+        SELECT chunk_id, text, summary, doc_name
+        FROM chunks
         WHERE chunk_id > ?
         ORDER BY chunk_id
     """, (last_processed_id,))
     new_chunks = cursor.fetchall()
-    
+
     if not new_chunks:
         logging.info("No new chunks to process")
         conn.close()
@@ -133,54 +336,114 @@ def process_entity_relations(db_path):
             "total_similarity_pairs": 0,
             "message": "No new chunks to process"
         }
-    
+
     logging.info(f"Fetched {len(new_chunks)} new chunks from the database")
 
     new_entities = []
-    new_summaries = {}
+    chunk_entities = {}
     for chunk_id, text, summary, doc_name in new_chunks:
-        chunk_entities = extract_entities(text, chunk_id, doc_name)
-        new_entities.extend(chunk_entities)
-        new_summaries[chunk_id] = summary
-    
+        entities = extract_entities(text, chunk_id, doc_name)
+        new_entities.extend(entities)
+        chunk_entities[chunk_id] = distinct_entities(entities)
+    # a previous run may have stored these chunks' entities before failing
+    cursor.execute("DELETE FROM chunk_entities WHERE chunk_id > ?", (last_processed_id,))
+    store_chunk_entities(conn, new_entities)
+
     logging.info(f"Extracted {len(new_entities)} entities from new chunks")
+    increment("entities_extracted_total", len(new_entities))
 
-    context_limit = 1000
-    min_chunk_id = min(new_summaries.keys())
-    cursor.execute("""
-        SELECT chunk_id, summary 
-        FROM chunks 
-        WHERE chunk_id <= ? 
-        ORDER BY chunk_id DESC 
-        LIMIT ?
-    """, (min_chunk_id - 1, context_limit))
-    context_chunks = cursor.fetchall()
-    
-    all_summaries = {chunk_id: summary for chunk_id, summary in context_chunks}
-    all_summaries.update(new_summaries)
-    
-    logging.info("Starting similarity score computation")
-    similarity_scores = precompute_similarities(all_summaries)
-    logging.info("Completed similarity score computation")
+    index = load_summary_index(conn, db_path)
+    new_ids = [chunk_id for chunk_id, _, _, _ in new_chunks]
+    new_embeddings = encode_summaries([summary for _, _, summary, _ in new_chunks])
+    store_summary_embeddings(conn, new_ids, new_embeddings)
+    add_missing_to_index(index, new_ids, new_embeddings)
+
+    logging.info("Starting k-NN neighbour search")
+    neighbor_pairs = find_neighbors(index, new_ids, new_embeddings)
+    store_neighbors(conn, neighbor_pairs)
+    similarity_scores = {
+        pair: score for pair, score in neighbor_pairs.items() if score >= CONFIDENCE_THRESHOLD
+    }
+    logging.info(f"Found {len(similarity_scores)} chunk pairs above the confidence threshold")
+
+    linked_ids = {chunk_id for pair in similarity_scores for chunk_id in pair}
+    chunk_entities.update(load_chunk_entities(conn, linked_ids - set(chunk_entities)))
 
     logging.info("Starting Neo4j storage")
-    store_in_neo4j(new_entities, similarity_scores)
+    store_in_neo4j(new_entities, chunk_entities, similarity_scores, tenant)
 
-    max_processed_id = max(new_summaries.keys())
+    max_processed_id = max(new_ids)
     cursor.execute("""
-        UPDATE processing_status 
+        UPDATE processing_status
         SET last_processed_chunk_id = ?,
             last_processed_timestamp = CURRENT_TIMESTAMP
         WHERE process_name = 'entity_processing'
     """, (max_processed_id,))
-    
+
     conn.commit()
     conn.close()
-    
+    # persisted only once the graph and checkpoint are written, so a failed run leaves no trace in it
+    faiss.write_index(index, summary_index_path(db_path))
+
     logging.info("Entity relation processing pipeline complete!")
     return {
         "total_chunks_processed": len(new_chunks),
         "total_entities_extracted": len(new_entities),
         "total_similarity_pairs": len(similarity_scores),
+        "total_neighbor_pairs": len(neighbor_pairs),
         "last_processed_chunk_id": max_processed_id
-    }
\ No newline at end of file
+    }
+
+def rebuild_knn_graph(db_path, k=KNN_NEIGHBORS):
+    """
+    Rebuild the summary k-NN index and the persisted neighbour table from the stored
+    summary embeddings, e.g. after changing k. No summaries are re-encoded.
+    """
+    conn = sqlite3.connect(db_path)
+    create_link_tables(conn)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chunk_id, embedding FROM summary_embeddings ORDER BY chunk_id")
+    rows = cursor.fetchall()
+
+    index = new_summary_index(sbert_model.get_sentence_embedding_dimension())
+    pairs = {}
+    if rows:
+        chunk_ids = [chunk_id for chunk_id, _ in rows]
+        embeddings = np.stack([np.frombuffer(embedding, dtype=np.float32) for _, embedding in rows])
+        index.add_with_ids(embeddings, np.array(chunk_ids, dtype=np.int64))
+        pairs = find_neighbors(index, chunk_ids, embeddings, k=k)
+    faiss.write_index(index, summary_index_path(db_path))
+
+    cursor.execute("DELETE FROM chunk_neighbors")
+    conn.commit()
+    store_neighbors(conn, pairs)
+    conn.close()
+    logging.info(f"Rebuilt k-NN graph with {len(pairs)} neighbour pairs over {len(rows)} chunks")
+    return {"total_chunks": len(rows), "total_neighbor_pairs": len(pairs)}
+
+def relink_chunks(db_path, threshold=CONFIDENCE_THRESHOLD, tenant=DEFAULT_TENANT_ID):
+    """
+    Re-create the tenant's CONTEXT_LINK relations in Neo4j from the persisted k-NN graph
+    using a new confidence threshold, without re-encoding anything.
+    """
+    conn = sqlite3.connect(db_path)
+    create_link_tables(conn)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chunk_id, neighbor_id, score FROM chunk_neighbors WHERE score >= ?", (threshold,))
+    similarity_scores = {(a, b): score for a, b, score in cursor.fetchall()}
+    linked_ids = {chunk_id for pair in similarity_scores for chunk_id in pair}
+    chunk_entities = load_chunk_entities(conn, linked_ids)
+    conn.close()
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    with driver.session() as session:
+        migrate_default_tenant(session)
+        session.run("MATCH (e:Entity {tenant: $tenant})-[r:CONTEXT_LINK]->() DELETE r", tenant=tenant)
+    driver.close()
+
+    links_created = store_in_neo4j([], chunk_entities, similarity_scores, tenant)
+    return {
+        "threshold": threshold,
+        "total_similarity_pairs": len(similarity_scores),
+        "total_links": links_created
+    }
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import faiss
+from .config import INDEX_CACHE_MAX_BYTES
+from .metrics import span, increment
+from .shards import ShardedIndex, load_manifest, shard_dir, shard_path, key_legacy_index, MANIFEST_NAME
+
+class IndexCache:
+    """
+    LRU cache of loaded vector indexes (monolithic FAISS files or worker-backed shard sets),
+    bounded by the total on-disk size of the cached indexes. Entries are reloaded when the
+    file (or shard layout) changes. An index larger than the whole budget is served
+    without being cached, so one large corpus cannot evict every other one; it is closed
+    as soon as the request using it releases it.
+    """
+
+    def __init__(self, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _describe(self, faiss_path):
+        """Return (version, size_bytes, sharded) of the index currently on disk."""
+        manifest = load_manifest(faiss_path)
+        if manifest is not None:
+            version = (os.path.getmtime(os.path.join(shard_dir(faiss_path), MANIFEST_NAME)),
+                       tuple(manifest["shards"]))
+            size = sum(
+                os.path.getsize(shard_path(faiss_path, name))
+                for name in manifest["shards"] if os.path.exists(shard_path(faiss_path, name))
+            )
+            return version, size, manifest
+        return os.path.getmtime(faiss_path), os.path.getsize(faiss_path), None
+
+    def _lookup(self, faiss_path, version):
+        """Return the cached entry with one reference taken, or None; the caller holds the lock."""
+        entry = self._entries.get(faiss_path)
+        if entry is not None and entry["version"] == version:
+            self._entries.move_to_end(faiss_path)
+            entry["refs"] += 1
+            return entry
+        return None
+
+    def acquire(self, faiss_path, db_path=None):
+        """
+        Return the entry for faiss_path with a reference taken, loading it (and evicting
+        LRU entries) on a miss. Every acquire must be paired with release(); an evicted
+        entry is only closed once its last user has released it. A legacy index whose
+        vectors are not keyed by chunk_id is keyed in place from db_path when loaded.
+        """
+        version, size, manifest = self._describe(faiss_path)
+        with self._lock:
+            entry = self._lookup(faiss_path, version)
+        if entry is not None:
+            increment("index_cache_hits_total")
+            return entry
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(faiss_path, threading.Lock())
+        with load_lock:
+            # another request may have loaded it while we waited
+            with self._lock:
+                entry = self._lookup(faiss_path, version)
+            if entry is not None:
+                increment("index_cache_hits_total")
+                return entry
+
+            increment("index_cache_misses_total")
+            with span("load_index"):
+                index = ShardedIndex(faiss_path, manifest) if manifest is not None else faiss.read_index(faiss_path)
+                if manifest is None and not hasattr(index, "id_map") and db_path is not None:
+                    # search hits would otherwise be positions, not chunk_ids
+                    index = key_legacy_index(faiss_path, db_path)
+                    version, size, _ = self._describe(faiss_path)
+            entry = {"index": index, "version": version, "size": size, "refs": 1, "evicted": False}
+
+            with self._lock:
+                self._discard(faiss_path)
+                if size > self.max_bytes:
+                    # served to this caller only and closed on release
+                    increment("index_cache_oversize_total")
+                    logging.warning(f"Index {faiss_path} ({size} bytes) exceeds the cache budget; not cached")
+                    entry["evicted"] = True
+                    return entry
+                self._entries[faiss_path] = entry
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    evicted_path = next(iter(self._entries))
+                    self._discard(evicted_path)
+                    increment("index_cache_evictions_total")
+                    logging.info(f"Evicted index {evicted_path} from the cache")
+            return entry
+
+    def release(self, entry):
+        with self._lock:
+            entry["refs"] -= 1
+            if entry["evicted"] and entry["refs"] == 0:
+                self._close(entry)
+
+    def _close(self, entry):
+        if isinstance(entry["index"], ShardedIndex):
+            entry["index"].close()
+
+    def _discard(self, faiss_path):
+        """Remove an entry, closing it now if unused or on its last release; the caller holds the lock."""
+        entry = self._entries.pop(faiss_path, None)
+        if entry is None:
+            return
+        self._bytes -= entry["size"]
+        entry["evicted"] = True
+        if entry["refs"] == 0:
+            self._close(entry)
+
+    def evict(self, faiss_path):
+        with self._lock:
+            self._discard(faiss_path)
+
+    def warm(self, faiss_path, db_path=None):
+        """Load faiss_path into the cache without keeping a reference."""
+        self.release(self.acquire(faiss_path, db_path))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "bytes": self._bytes,
+                "indexes": [
+                    {"faiss_path": path, "bytes": entry["size"]}
+                    for path, entry in reversed(self._entries.items())
+                ]
+            }
+
+index_cache = IndexCache()
+
+@contextmanager
+def search_index(faiss_path, db_path=None):
+    """
+    The index to search for faiss_path (shard workers when sharded, the FAISS file otherwise),
+    held for the duration of the with block so eviction cannot close it mid-search. db_path
+    is the chunk database used to key a legacy index by chunk_id.
+    """
+    entry = index_cache.acquire(faiss_path, db_path)
+    try:
+        yield entry["index"]
+    finally:
+        index_cache.release(entry)
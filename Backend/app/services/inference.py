@@ -0,0 +1,174 @@
+import logging
+import os
+from functools import lru_cache
+import numpy as np
+from .config import INFERENCE_BACKEND, ONNX_MODEL_DIR, ONNX_QUANTIZE, ONNX_INTRA_OP_THREADS
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+SUMMARIZATION_MODEL_NAME = "facebook/bart-large-cnn"
+
+def _onnx_session_options(intra_op_threads):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    return options
+
+def _quantize_onnx_dir(model_dir, quantized_dir):
+    """Apply dynamic int8 quantization to every ONNX file in model_dir."""
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    for file_name in sorted(os.listdir(model_dir)):
+        if file_name.endswith(".onnx"):
+            quantizer = ORTQuantizer.from_pretrained(model_dir, file_name=file_name)
+            quantizer.quantize(save_dir=quantized_dir, quantization_config=qconfig)
+
+def export_onnx_model(model_name, model_class, quantize=False, model_dir=ONNX_MODEL_DIR):
+    """
+    Export a Hugging Face model to ONNX once and cache it under model_dir,
+    optionally with dynamic int8 quantization.
+
+    Returns:
+        str: Directory holding the exported (and possibly quantized) model.
+    """
+    export_dir = os.path.join(model_dir, model_name.replace("/", "__"))
+    quantized_dir = export_dir + "-int8"
+
+    if not os.path.exists(export_dir):
+        logging.info(f"Exporting {model_name} to ONNX at {export_dir}")
+        model = model_class.from_pretrained(model_name, export=True)
+        model.save_pretrained(export_dir)
+        from transformers import AutoTokenizer
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+
+    if not quantize:
+        return export_dir
+
+    if not os.path.exists(quantized_dir):
+        logging.info(f"Quantizing {model_name} to int8 at {quantized_dir}")
+        _quantize_onnx_dir(export_dir, quantized_dir)
+        from transformers import AutoTokenizer
+        AutoTokenizer.from_pretrained(export_dir).save_pretrained(quantized_dir)
+        for file_name in os.listdir(export_dir):
+            if file_name.endswith(".json") and not os.path.exists(os.path.join(quantized_dir, file_name)):
+                with open(os.path.join(export_dir, file_name), "rb") as src, \
+                        open(os.path.join(quantized_dir, file_name), "wb") as dst:
+                    dst.write(src.read())
+    return quantized_dir
+
+class OnnxSentenceEncoder:
+    """
+    ONNX Runtime implementation of all-MiniLM-L6-v2 with the same interface as the
+    SentenceTransformer.encode calls used in this app: mean pooling over token
+    embeddings followed by L2 normalization.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, quantize=ONNX_QUANTIZE,
+                 intra_op_threads=ONNX_INTRA_OP_THREADS, max_seq_length=256):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        model_dir = export_onnx_model(model_name, ORTModelForFeatureExtraction, quantize=quantize)
+        onnx_files = sorted(f for f in os.listdir(model_dir) if f.endswith(".onnx"))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, onnx_files[0]),
+            sess_options=_onnx_session_options(intra_op_threads),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+        self.dimension = None
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        feeds = {name: tokens[name].astype(np.int64) for name in tokens if name in self.input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, convert_to_tensor=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            embeddings = np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        else:
+            # Sort by length so each batch pads to a similar length, then restore order.
+            order = np.argsort([-len(t) for t in texts], kind="stable")
+            batches = [
+                self._encode_batch([texts[i] for i in order[start:start + batch_size]])
+                for start in range(0, len(texts), batch_size)
+            ]
+            embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+            embeddings[order] = np.concatenate(batches)
+
+        if single:
+            embeddings = embeddings[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embeddings)
+        return embeddings
+
+    def get_sentence_embedding_dimension(self):
+        if self.dimension is None:
+            self.dimension = int(self._encode_batch(["dimension probe"]).shape[1])
+        return self.dimension
+
+def load_embedding_model(backend, quantize=ONNX_QUANTIZE, intra_op_threads=ONNX_INTRA_OP_THREADS):
+    """Load the MiniLM sentence encoder for the given backend ("torch" or "onnx")."""
+    if backend == "onnx":
+        return OnnxSentenceEncoder(quantize=quantize, intra_op_threads=intra_op_threads)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer('all-MiniLM-L6-v2')
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+def load_summarizer(backend, quantize=ONNX_QUANTIZE, intra_op_threads=ONNX_INTRA_OP_THREADS):
+    """Load the BART summarization pipeline for the given backend ("torch" or "onnx")."""
+    from transformers import pipeline, AutoTokenizer
+
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        model_dir = export_onnx_model(SUMMARIZATION_MODEL_NAME, ORTModelForSeq2SeqLM, quantize=quantize)
+        file_names = {}
+        if quantize:
+            available = set(os.listdir(model_dir))
+            for argument, file_name in (
+                ("encoder_file_name", "encoder_model_quantized.onnx"),
+                ("decoder_file_name", "decoder_model_quantized.onnx"),
+                ("decoder_with_past_file_name", "decoder_with_past_model_quantized.onnx"),
+            ):
+                if file_name in available:
+                    file_names[argument] = file_name
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            model_dir,
+            session_options=_onnx_session_options(intra_op_threads),
+            provider="CPUExecutionProvider",
+            **file_names
+        )
+        return pipeline("summarization", model=model, tokenizer=AutoTokenizer.from_pretrained(model_dir))
+    if backend == "torch":
+        return pipeline("summarization", model=SUMMARIZATION_MODEL_NAME, device=-1)
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    """Shared MiniLM encoder for the configured INFERENCE_BACKEND."""
+    return load_embedding_model(INFERENCE_BACKEND)
+
+@lru_cache(maxsize=None)
+def get_summarizer():
+    """Shared BART summarizer for the configured INFERENCE_BACKEND."""
+    return load_summarizer(INFERENCE_BACKEND)
@@ -0,0 +1,102 @@
+import logging
+import re
+import sqlite3
+
+MAX_QUERY_TERMS = 64
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with",
+    "context", "what", "which", "who", "how", "do", "does", "must", "shall", "should", "all", "any",
+}
+
+TERM_PATTERN = re.compile(r"\w(?:[\w./-]*\w)?")
+
+def ensure_fts_index(conn):
+    """
+    Create the chunks_fts FTS5 table and the triggers that keep it in sync with
+    the chunks table. Existing chunks are indexed the first time the table is created.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'")
+    existed = cursor.fetchone() is not None
+
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            text,
+            content='chunks',
+            content_rowid='chunk_id',
+            tokenize='porter unicode61'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts (rowid, text) VALUES (new.chunk_id, new.text);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.chunk_id, old.text);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE OF text ON chunks BEGIN
+            INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.chunk_id, old.text);
+            INSERT INTO chunks_fts (rowid, text) VALUES (new.chunk_id, new.text);
+        END
+    """)
+
+    if not existed:
+        logging.info("Building FTS5 index over existing chunks")
+        cursor.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+    conn.commit()
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 MATCH expression: every distinct, non-stopword term
+    becomes a quoted phrase, OR-ed together. Quoting keeps section numbers such as
+    "21.3" or "211.68(b)" matching as exact token sequences.
+    """
+    terms = []
+    seen = set()
+    for term in TERM_PATTERN.findall(query.lower()):
+        if term in STOPWORDS or term in seen:
+            continue
+        seen.add(term)
+        terms.append('"' + term.replace('"', '""') + '"')
+        if len(terms) >= MAX_QUERY_TERMS:
+            break
+    return " OR ".join(terms)
+
+def lexical_search(conn, query, top_k=5):
+    """
+    BM25 keyword search over chunk texts.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the chunks database.
+        query (str): Free-text query.
+        top_k (int): Number of results to return.
+
+    Returns:
+        list: (chunk_id, bm25) pairs, best first. FTS5 bm25 scores are negative;
+              lower is better.
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT rowid, bm25(chunks_fts)
+            FROM chunks_fts
+            WHERE chunks_fts MATCH ?
+            ORDER BY bm25(chunks_fts)
+            LIMIT ?
+        """, (match_query, top_k))
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        ensure_fts_index(conn)
+        return lexical_search(conn, query, top_k)
+    return cursor.fetchall()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from .config import LLM_CACHE_PATH
+
+def create_cache_db(db_path=LLM_CACHE_PATH):
+    """Create the LLM analysis cache table if it does not exist yet."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            template_version TEXT NOT NULL,
+            analysis TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_template_version
+        ON llm_cache (template_version)
+    """)
+    conn.commit()
+    conn.close()
+
+def make_cache_key(model, template_version, chunk_text, context_chunk_ids):
+    """
+    Build the cache key for one LLM analysis.
+
+    Args:
+        model (str): Name of the chat model.
+        template_version (str): Version of the prompt template.
+        chunk_text (str): Text of the SOP chunk being analyzed.
+        context_chunk_ids (list): Ids of the retrieved regulatory chunks, in prompt order.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the analysis.
+    """
+    payload = json.dumps(
+        [model, template_version, chunk_text, list(context_chunk_ids)],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_analysis(cache_key, db_path=LLM_CACHE_PATH):
+    """Return the cached analysis text for a key, or None on a miss."""
+    if not os.path.exists(db_path):
+        return None
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT analysis FROM llm_cache WHERE cache_key = ?", (cache_key,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def store_analysis(cache_key, model, template_version, analysis, db_path=LLM_CACHE_PATH):
+    """Persist an analysis under its cache key, replacing any previous entry."""
+    if not os.path.exists(db_path):
+        create_cache_db(db_path)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR REPLACE INTO llm_cache (cache_key, model, template_version, analysis)
+        VALUES (?, ?, ?, ?)
+    """, (cache_key, model, template_version, analysis))
+    conn.commit()
+    conn.close()
+
+def purge_cache(template_version, db_path=LLM_CACHE_PATH):
+    """
+    Delete all cached analyses produced with a given prompt template version.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if not os.path.exists(db_path):
+        return 0
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM llm_cache WHERE template_version = ?", (template_version,))
+    purged = cursor.rowcount
+    conn.commit()
+    conn.close()
+
+    logging.info(f"Purged {purged} cached analyses for template version {template_version}")
+    return purged
@@ -1,6 +1,17 @@
 #!/usr/bin/env python3
 import sys
 import fitz  # PyMuPDF
+import numpy as np
+from .config import LAYOUT_ENGINE
+from .metrics import timed, increment
+
+# Text-only "dict" extraction: image blocks never carry lines, so skipping them
+# (and their pixel data) leaves the layout result unchanged.
+TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# "blocks" extraction returns one (x0, y0, x1, y1, text, block_no, type) tuple per block
+# and builds no per-line or per-span dicts; this is what makes the vectorized engine fast.
+TEXT_BLOCK_FLAGS = fitz.TEXTFLAGS_BLOCKS & ~fitz.TEXT_PRESERVE_IMAGES
 
 def extract_text_from_page(page, zone_threshold=15, horizontal_threshold_ratio=0.2):
     """
@@ -11,7 +22,7 @@ def extract_text_from_page(page, zone_threshold=15, horizontal_threshold_ratio=0
        into left and right columns (left-first); otherwise, treat as a single column.
     4. Concatenate text from each group in order.
     """
-    blocks = page.get_text("dict")["blocks"]
+    blocks = page.get_text("dict", flags=TEXT_DICT_FLAGS)["blocks"]
     text_blocks = [b for b in blocks if b.get("lines")]
     if not text_blocks:
         return ""
@@ -94,16 +105,130 @@ def process_zone_group(blocks, page_width, horizontal_threshold_ratio=0.2):
             out += "\n"
         return out
 
-def extract_pdf_text(pdf_path, zone_threshold=15, horizontal_threshold_ratio=0.2):
+def page_block_arrays(page):
+    """
+    Pull the geometry and text of the text blocks on a page from the lightweight
+    "blocks" extraction.
+    
+    Returns:
+        tuple: (x0, y0, y1) float64 arrays and a list of block texts, each rendered
+               as its lines followed by a blank line. Spans are joined as they appear
+               on the page, without the space the reference engine adds between them.
+    """
+    bboxes = []
+    texts = []
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", flags=TEXT_BLOCK_FLAGS):
+        if block_type != 0 or not text:
+            continue
+        bboxes.append((x0, y0, x1, y1))
+        texts.append(text + "\n")
+    bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+    return bboxes[:, 0], bboxes[:, 1], bboxes[:, 3], texts
+
+def zone_starts(tops, zone_threshold):
+    """
+    Start indices of the vertical zones over sorted block tops. A zone holds every block
+    whose top is less than zone_threshold below the top of the zone's first block.
+    """
+    starts = [0]
+    n = len(tops)
+    start = 0
+    while True:
+        zone_top = tops[start]
+        end = int(np.searchsorted(tops, zone_top + zone_threshold, side="left"))
+        # Settle the boundary with the same float expression as the reference engine.
+        while end > start + 1 and not tops[end - 1] - zone_top < zone_threshold:
+            end -= 1
+        while end < n and tops[end] - zone_top < zone_threshold:
+            end += 1
+        end = max(end, start + 1)
+        if end >= n:
+            return np.array(starts, dtype=np.intp)
+        starts.append(end)
+        start = end
+
+def extract_text_from_page_vectorized(page, zone_threshold=15, horizontal_threshold_ratio=0.2):
+    """
+    Same layout algorithm as extract_text_from_page, computed on NumPy arrays of block
+    geometry from page_block_arrays: zones come from searchsorted over the sorted block
+    tops, zone merging from a running maximum of zone bottoms, and column partitioning
+    and reading order from segmented reductions and one stable lexsort per page.
+    The block order and lines match the reference engine; only lines made of several
+    spans differ, as they are not joined with extra spaces.
+    """
+    x0, y0, y1, texts = page_block_arrays(page)
+    if not texts:
+        return ""
+    if np.any(y1 < y0):
+        # Inverted boxes break the running-maximum merge; use the reference engine.
+        return extract_text_from_page(page, zone_threshold, horizontal_threshold_ratio)
+    
+    order = np.argsort(y0, kind="stable")
+    x0, y0, y1 = x0[order], y0[order], y1[order]
+    
+    starts = zone_starts(y0, zone_threshold)
+    zone_y_min = y0[starts]
+    zone_y_max = np.maximum.reduceat(y1, starts)
+    # A zone joins the current group when its top is within the group's bottom. Since every
+    # group's bottom exceeds all earlier groups, the running maximum over all previous
+    # zones equals the current group's bottom.
+    new_group = np.empty(len(starts), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = zone_y_min[1:] > np.maximum.accumulate(zone_y_max)[:-1]
+    group_starts = starts[new_group]
+    group_sizes = np.diff(np.append(group_starts, len(y0)))
+    group_ids = np.repeat(np.arange(len(group_starts)), group_sizes)
+    
+    # Groups spread wider than the threshold are split into left/right columns at their
+    # median x (upper median of the sorted x values), left column first.
+    two_columns = (
+        np.maximum.reduceat(x0, group_starts) - np.minimum.reduceat(x0, group_starts)
+        > horizontal_threshold_ratio * page.rect.width
+    )
+    x_sorted = x0[np.lexsort((x0, group_ids))]
+    median_x = x_sorted[group_starts + group_sizes // 2]
+    right_column = two_columns[group_ids] & (x0 >= median_x[group_ids])
+    
+    # lexsort is stable, so ties keep the top-sorted order like the reference engine.
+    layout_order = np.lexsort((x0, y0, right_column, group_ids))
+    group_ends = set((group_starts + group_sizes - 1).tolist())
+    return "".join(
+        texts[i] + "\n" if position in group_ends else texts[i]
+        for position, i in enumerate(order[layout_order].tolist())
+    )
+
+LAYOUT_ENGINES = {
+    "reference": extract_text_from_page,
+    "vectorized": extract_text_from_page_vectorized,
+}
+
+def iter_pdf_pages(pdf_path, zone_threshold=15, horizontal_threshold_ratio=0.2, engine=None):
+    """
+    Extract a PDF one page at a time with the merged zone approach.
+    engine selects the layout implementation ("reference" or "vectorized"),
+    defaulting to LAYOUT_ENGINE.
+    
+    Yields:
+        tuple: (page_number, page_text), page numbers starting at 1.
+    """
+    extract_page = LAYOUT_ENGINES[engine or LAYOUT_ENGINE]
+    doc = fitz.open(pdf_path)
+    try:
+        for i, page in enumerate(doc):
+            yield i + 1, extract_page(page, zone_threshold, horizontal_threshold_ratio)
+            increment("pdf_pages_extracted_total")
+    finally:
+        doc.close()
+
+@timed("extract_pdf_text")
+def extract_pdf_text(pdf_path, zone_threshold=15, horizontal_threshold_ratio=0.2, engine=None):
     """
     Process the PDF file page by page using our merged zone approach.
     Returns one large string with page separators.
     """
-    doc = fitz.open(pdf_path)
     full_text = ""
-    for i, page in enumerate(doc):
-        page_text = extract_text_from_page(page, zone_threshold, horizontal_threshold_ratio)
-        full_text += f"--- Page {i+1} ---\n{page_text}\n"
+    for page_number, page_text in iter_pdf_pages(pdf_path, zone_threshold, horizontal_threshold_ratio, engine):
+        full_text += f"--- Page {page_number} ---\n{page_text}\n"
     return full_text
 
 # if __name__ == "__main__":
@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+import time
+from .metrics import observe, increment
+
+_DONE = object()
+
+class Stage:
+    """One step of a StagedPipeline: a function applied to each item by its own worker threads."""
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+
+class PipelineItem:
+    """An item flowing through the pipeline. Once a stage fails, later stages pass it through."""
+
+    def __init__(self, key, payload):
+        self.key = key
+        self.payload = payload
+        self.error = None
+        self.failed_stage = None
+
+class StagedPipeline:
+    """
+    Run items through a sequence of stages connected by bounded queues.
+
+    Every stage has its own pool of worker threads, so different items occupy
+    different stages at the same time: while one document is parsed, another is
+    embedded and a third summarized. Bounded queues apply backpressure, keeping the
+    number of in-flight items (and memory) bounded, and throughput is limited by
+    the slowest stage rather than the sum of all stages.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.stats = {
+            stage.name: {"workers": stage.workers, "items": 0, "busy_seconds": 0.0, "errors": 0}
+            for stage in stages
+        }
+        self._stats_lock = threading.Lock()
+
+    def _worker(self, stage, inbox, outbox, finished):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+
+            if item.error is None:
+                start = time.perf_counter()
+                try:
+                    item.payload = stage.fn(item.payload)
+                except Exception as e:
+                    logging.exception(f"Pipeline stage {stage.name} failed for {item.key}")
+                    item.error = str(e)
+                    item.failed_stage = stage.name
+                elapsed = time.perf_counter() - start
+                observe("pipeline_stage_seconds", elapsed, stage=stage.name)
+                with self._stats_lock:
+                    stats = self.stats[stage.name]
+                    stats["items"] += 1
+                    stats["busy_seconds"] += elapsed
+                    if item.error is not None and item.failed_stage == stage.name:
+                        stats["errors"] += 1
+                        increment("pipeline_errors_total", stage=stage.name)
+            outbox.put(item)
+
+        # The last worker of a stage to finish tells every worker downstream to stop.
+        with finished["lock"]:
+            finished["count"] += 1
+            last = finished["count"] == stage.workers
+        if last:
+            for _ in range(finished["downstream_workers"]):
+                outbox.put(_DONE)
+
+    def run(self, items):
+        """
+        Push (key, payload) pairs through every stage and yield finished PipelineItems
+        as they leave the last stage, in completion order.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = queue.Queue(maxsize=self.queue_size)
+        queues.append(results)
+
+        threads = []
+        for i, stage in enumerate(self.stages):
+            downstream_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            finished = {"lock": threading.Lock(), "count": 0, "downstream_workers": downstream_workers}
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage, queues[i], queues[i + 1], finished),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        def feed():
+            for key, payload in items:
+                queues[0].put(PipelineItem(key, payload))
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, name="pipeline-feeder", daemon=True)
+        feeder.start()
+
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            yield item
+
+        feeder.join()
+        for thread in threads:
+            thread.join()
@@ -7,11 +7,35 @@ nltk.download('punkt_tab')
 from nltk.tokenize import sent_tokenize
 from semantic_router.encoders import HuggingFaceEncoder
 from semantic_chunkers import StatisticalChunker
+from .metrics import span, timed, increment
+from .config import CHUNK_WINDOW_PAGES
+from .embedding_service import get_embedding_service
 
 REG_MIN_tokens = 200
 REG_MAX_tokens = 1000
 
-encoder = HuggingFaceEncoder(name="sentence-transformers/all-MiniLM-L6-v2")
+SOP_MIN_tokens = 100
+SOP_MAX_tokens = 500
+
+class BatchedEncoder(HuggingFaceEncoder):
+    """
+    HuggingFaceEncoder that encodes through the shared embedding service, so the
+    statistical chunker batches with retrieval and entity linking and reuses the
+    already loaded MiniLM model instead of loading its own copy.
+    """
+
+    def _initialize_hf_model(self):
+        return None, None
+
+    def __call__(self, docs, batch_size=32, **kwargs):
+        return get_embedding_service().encode(docs, batch_size=batch_size).tolist()
+
+encoder = BatchedEncoder(name="sentence-transformers/all-MiniLM-L6-v2")
+sop_chunker = StatisticalChunker(
+    encoder=encoder,
+    min_split_tokens=SOP_MIN_tokens,
+    max_split_tokens=SOP_MAX_tokens,
+)
 
 def process_regulatory_text(content):
     """
@@ -70,6 +94,27 @@ def get_page_range(start, end, page_starts):
         return str(start_page + 1)
     return f"{start_page + 1}-{end_page + 1}"
 
+def sentence_spans(text):
+    """
+    Split text into sentences and locate each one in the original string.
+    
+    Args:
+        text (str): Text to split.
+    
+    Returns:
+        list: List of (start, end) character offsets, one per sentence.
+    """
+    spans = []
+    current_pos = 0
+    for sent in sent_tokenize(text):
+        start = text.find(sent, current_pos)
+        if start == -1:
+            start = current_pos
+        end = min(start + len(sent), len(text))
+        spans.append((start, end))
+        current_pos = end
+    return spans
+
 def statistical_chunking(text, min_tokens, max_tokens, page_starts, doc_name, overlap_sentences=0):
     """
     Split text into chunks using StatisticalChunker with optional sentence-based overlap.
@@ -93,7 +138,8 @@ def statistical_chunking(text, min_tokens, max_tokens, page_starts, doc_name, ov
         max_split_tokens=max_tokens,
     )
     
-    chunks = chunker(docs=[text])
+    with span("statistical_chunker"):
+        chunks = chunker(docs=[text])
     initial_chunks = [chunk.content for chunk in chunks[0]]
     
     if overlap_sentences == 0:
@@ -162,13 +208,38 @@ def statistical_chunking(text, min_tokens, max_tokens, page_starts, doc_name, ov
     logging.debug(f"Generated {len(overlapped_chunks)} overlapped chunks.")
     return overlapped_chunks
 
-def preprocess_documents(regulatory_text, MIN_tokens, MAX_tokens, reg_overlap_sentences=1):
+def chunk_sop_text(text, doc_name):
+    """
+    Split SOP text into chunks with the SOP chunker settings.
+    
+    Args:
+        text (str): Extracted SOP text.
+        doc_name (str): Name of the SOP document.
+    
+    Returns:
+        list: List of dictionaries, each containing 'text', 'doc_name', and 'page_range'.
+    """
+    with span("statistical_chunker"):
+        chunks = sop_chunker(docs=[text])
+    return [
+        {
+            'text': chunk.content,
+            'doc_name': doc_name,
+            'page_range': 'N/A'
+        }
+        for chunk in chunks[0]
+    ]
+
+@timed("preprocess_documents")
+def preprocess_documents(regulatory_text, MIN_tokens, MAX_tokens, reg_overlap_sentences=1,
+                         doc_name="regulatory_document"):
     """
     Preprocess regulatory text by chunking it with metadata and optional overlap.
     
     Args:
         regulatory_text (str): The regulatory text content with page delimiters.
         reg_overlap_sentences (int): Sentences to overlap for regulatory chunks (default: 1).
+        doc_name (str): Document name recorded on each chunk.
     
     Returns:
         list: regulatory_chunks, a list of chunk dictionaries.
@@ -177,7 +248,111 @@ def preprocess_documents(regulatory_text, MIN_tokens, MAX_tokens, reg_overlap_se
     
     regulatory_chunks = statistical_chunking(
         full_text, MIN_tokens, MAX_tokens, regulatory_page_starts, 
-        doc_name="regulatory_document", overlap_sentences=reg_overlap_sentences
+        doc_name=doc_name, overlap_sentences=reg_overlap_sentences
     )
+    increment("chunks_created_total", len(regulatory_chunks))
     
     return regulatory_chunks
+
+def locate_chunks(text, chunk_texts):
+    """Find the (start, end) offsets of consecutive chunk texts in the text they came from."""
+    spans = []
+    current_pos = 0
+    for chunk_text in chunk_texts:
+        start = text.find(chunk_text, current_pos)
+        if start == -1:
+            start = current_pos
+        end = min(start + len(chunk_text), len(text))
+        spans.append((start, end))
+        current_pos = end
+    return spans
+
+def iter_windowed_chunks(pages, MIN_tokens, MAX_tokens, reg_overlap_sentences=1,
+                         doc_name="regulatory_document", window_pages=CHUNK_WINDOW_PAGES):
+    """
+    Chunk a document page window by page window instead of all at once.
+    
+    Each window (window_pages non-empty pages) is chunked with the statistical chunker. The
+    last chunk of a window may have been cut by the window edge, so it is not emitted but
+    carried into the next window and re-chunked with the following pages. Only one window
+    plus one carried chunk is held at a time, whatever the document length.
+    
+    Args:
+        pages (iterable): (page_number, page_text) pairs, e.g. from parse.iter_pdf_pages.
+        MIN_tokens, MAX_tokens (int): Chunk size bounds for the statistical chunker.
+        reg_overlap_sentences (int): Sentences of the previous chunk prepended to each chunk.
+        doc_name (str): Document name recorded on each chunk.
+        window_pages (int): Pages per window.
+    
+    Yields:
+        list: The chunk dictionaries ('text', 'doc_name', 'page_range') completed by each window.
+    """
+    chunker = StatisticalChunker(
+        encoder=encoder,
+        min_split_tokens=MIN_tokens,
+        max_split_tokens=MAX_tokens,
+    )
+    pages = iter(pages)
+    carry_text = ""
+    carry_pages = []
+    overlap = []
+    exhausted = False
+    
+    while not exhausted:
+        text = carry_text
+        page_offsets = list(carry_pages)
+        added = 0
+        for page_number, page_text in pages:
+            page_text = page_text.strip()
+            if not page_text:
+                continue
+            page_offsets.append((len(text), page_number))
+            text += page_text
+            added += 1
+            if added >= window_pages:
+                break
+        else:
+            exhausted = True
+        if not text:
+            continue
+        
+        offsets = [offset for offset, _ in page_offsets]
+        
+        def page_at(position):
+            return page_offsets[max(0, bisect.bisect_right(offsets, position) - 1)][1]
+        
+        with span("statistical_chunker"):
+            chunk_texts = [chunk.content for chunk in chunker(docs=[text])[0]]
+        spans = locate_chunks(text, chunk_texts)
+        
+        emit_count = len(chunk_texts) if exhausted else len(chunk_texts) - 1
+        batch = []
+        for chunk_text, (start, end) in zip(chunk_texts[:emit_count], spans[:emit_count]):
+            first_page = page_at(start)
+            if reg_overlap_sentences:
+                sentences = [
+                    (chunk_text[s:e], page_at(start + s)) for s, e in sentence_spans(chunk_text)
+                ]
+                if overlap:
+                    first_page = overlap[0][1]
+                chunk_text = ' '.join(sentence for sentence, _ in overlap + sentences)
+                overlap = sentences[-reg_overlap_sentences:]
+            last_page = page_at(max(start, end - 1))
+            batch.append({
+                'text': chunk_text,
+                'doc_name': doc_name,
+                'page_range': str(first_page) if first_page == last_page else f"{first_page}-{last_page}"
+            })
+        
+        if not exhausted:
+            carry_start = spans[emit_count][0] if spans else 0
+            carry_text = text[carry_start:]
+            carry_pages = [
+                (max(0, offset - carry_start), page_number)
+                for i, (offset, page_number) in enumerate(page_offsets)
+                if i + 1 == len(page_offsets) or page_offsets[i + 1][0] > carry_start
+            ]
+        
+        if batch:
+            increment("chunks_created_total", len(batch))
+            yield batch
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+from functools import lru_cache
+import numpy as np
+import tiktoken
+from .preprocess import sentence_spans
+from .retrieval import embedding_model
+from .config import CONTEXT_TOKEN_BUDGET
+
+SENTENCE_SEPARATOR = " ... "
+GROUP_MARKER = "=== SOP CHUNK {} ==="
+GROUP_MARKER_PATTERN = re.compile(r"=== SOP CHUNK (\d+) ===")
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """Return the tiktoken encoding used by a chat model."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text, model):
+    """Count the tokens a piece of text occupies in a prompt for the given model."""
+    return len(get_encoding(model).encode(text))
+
+def result_id(result):
+    """
+    Return the identifier of a retrieved regulatory chunk.
+    Results without a chunk id fall back to a digest of their text.
+    """
+    chunk_id = result.get('chunk_id')
+    if chunk_id is None:
+        chunk_id = hashlib.sha256(result['text'].encode("utf-8")).hexdigest()
+    return chunk_id
+
+def format_context(results):
+    """Render regulatory context compactly for a prompt, keeping the citation fields."""
+    return json.dumps([{
+        'text': r['text'],
+        'source': r.get('doc_name', 'Unknown'),
+        'page': r.get('page_range', 'N/A')
+    } for r in results], ensure_ascii=False, separators=(",", ":"))
+
+def load_chunk_sentences(db_path, chunk_ids):
+    """
+    Load stored sentence offsets and embeddings for the given chunks.
+
+    Args:
+        db_path (str): Path to the SQLite database.
+        chunk_ids (list): Chunk ids to look up.
+
+    Returns:
+        dict: chunk_id -> list of (start, end, embedding) in sentence order.
+    """
+    ids = [chunk_id for chunk_id in chunk_ids if isinstance(chunk_id, int)]
+    if not db_path or not ids:
+        return {}
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT chunk_id, start_offset, end_offset, embedding
+            FROM chunk_sentences
+            WHERE chunk_id IN ({})
+            ORDER BY chunk_id, sentence_index
+        """.format(','.join('?' for _ in ids)), ids)
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError:
+        # Databases created before sentence storage have no chunk_sentences table.
+        rows = []
+    finally:
+        conn.close()
+
+    sentences = {}
+    for chunk_id, start, end, embedding in rows:
+        sentences.setdefault(chunk_id, []).append(
+            (start, end, np.frombuffer(embedding, dtype=np.float32))
+        )
+    return sentences
+
+def trim_context_to_budget(sop_text, results, model, token_budget=CONTEXT_TOKEN_BUDGET, db_path=None):
+    """
+    Trim retrieved regulatory chunks so their combined text fits a token budget.
+
+    Sentences are ranked by similarity to the SOP text using the stored sentence
+    embeddings (or freshly encoded ones for chunks stored without them). The best
+    sentence of every chunk is kept first so each source stays citable, then the
+    remaining budget is filled by similarity. Kept sentences stay in document order.
+
+    Args:
+        sop_text (str): SOP text the context will be compared against.
+        results (list): Retrieved regulatory chunks.
+        model (str): Chat model whose tokenizer is used for counting.
+        token_budget (int): Maximum number of context tokens.
+        db_path (str): Path to the SQLite database holding chunk sentences.
+
+    Returns:
+        list: Results with their text trimmed to the selected sentences.
+    """
+    if not results:
+        return results
+    if sum(count_tokens(r['text'], model) for r in results) <= token_budget:
+        return results
+
+    stored = load_chunk_sentences(db_path, [r.get('chunk_id') for r in results])
+
+    chunk_sentences = []
+    texts_to_encode = [sop_text]
+    for r in results:
+        rows = stored.get(r.get('chunk_id'))
+        if rows:
+            sentences = [[r['text'][start:end], embedding] for start, end, embedding in rows]
+        else:
+            sentences = [[r['text'][start:end], None] for start, end in sentence_spans(r['text'])]
+            texts_to_encode.extend(text for text, _ in sentences)
+        chunk_sentences.append(sentences)
+
+    encoded = embedding_model.encode(texts_to_encode, convert_to_numpy=True)
+    sop_embedding = encoded[0]
+    next_encoded = 1
+    for sentences in chunk_sentences:
+        for sentence in sentences:
+            if sentence[1] is None:
+                sentence[1] = encoded[next_encoded]
+                next_encoded += 1
+
+    separator_tokens = count_tokens(SENTENCE_SEPARATOR, model)
+    ranked = []
+    for chunk_pos, sentences in enumerate(chunk_sentences):
+        for sent_pos, (text, embedding) in enumerate(sentences):
+            ranked.append((
+                float(np.dot(embedding, sop_embedding)),
+                chunk_pos,
+                sent_pos,
+                count_tokens(text, model) + separator_tokens
+            ))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+
+    selected = set()
+    used_tokens = 0
+    covered_chunks = set()
+    for score, chunk_pos, sent_pos, tokens in ranked:
+        if chunk_pos not in covered_chunks and used_tokens + tokens <= token_budget:
+            selected.add((chunk_pos, sent_pos))
+            covered_chunks.add(chunk_pos)
+            used_tokens += tokens
+    for score, chunk_pos, sent_pos, tokens in ranked:
+        if (chunk_pos, sent_pos) not in selected and used_tokens + tokens <= token_budget:
+            selected.add((chunk_pos, sent_pos))
+            used_tokens += tokens
+
+    trimmed = []
+    for chunk_pos, (r, sentences) in enumerate(zip(results, chunk_sentences)):
+        kept = [text for sent_pos, (text, _) in enumerate(sentences) if (chunk_pos, sent_pos) in selected]
+        if kept:
+            trimmed.append({**r, 'text': SENTENCE_SEPARATOR.join(kept)})
+
+    logging.debug(f"Trimmed regulatory context to {used_tokens} tokens across {len(trimmed)} chunks")
+    return trimmed
+
+def group_chunks_by_context(chunks, contexts, min_shared=0.6, max_group_size=3):
+    """
+    Group adjacent SOP chunks whose retrieved context mostly overlaps so they can
+    share a single LLM call. The context of a group is the de-duplicated union of
+    its members' results.
+
+    Args:
+        chunks (list): SOP chunks in document order.
+        contexts (list): Retrieved results for each chunk, aligned with chunks.
+        min_shared (float): Minimum fraction of context ids a chunk must share with
+            the first chunk of the group to join it.
+        max_group_size (int): Maximum number of chunks per group.
+
+    Returns:
+        list: (chunk_indices, merged_results) tuples in document order.
+    """
+    groups = []
+    anchor_ids = set()
+    for i, results in enumerate(contexts):
+        ids = {result_id(r) for r in results}
+        if groups and len(groups[-1][0]) < max_group_size:
+            denominator = max(len(ids), len(anchor_ids))
+            if denominator and len(ids & anchor_ids) / denominator >= min_shared:
+                chunk_indices, merged = groups[-1]
+                chunk_indices.append(i)
+                seen = {result_id(r) for r in merged}
+                merged.extend(r for r in results if result_id(r) not in seen)
+                continue
+        groups.append(([i], list(results)))
+        anchor_ids = ids
+    return groups
+
+def build_analysis_prompt(chunks, context_results):
+    """Build the compliance analysis prompt for one SOP chunk or a group of adjacent chunks."""
+    if len(chunks) == 1:
+        sop_section = f"""SOP DOCUMENT CHUNK:
+{chunks[0]['text']}
+Source: {chunks[0].get('doc_name', 'Unknown')}"""
+        group_instructions = ""
+    else:
+        sop_section = "SOP DOCUMENT CHUNKS:\n" + "\n".join(
+            f"{GROUP_MARKER.format(i + 1)}\n{chunk['text']}\nSource: {chunk.get('doc_name', 'Unknown')}"
+            for i, chunk in enumerate(chunks)
+        )
+        group_instructions = (
+            f"\nAnswer separately for every SOP chunk, starting each answer with its heading "
+            f"(e.g. {GROUP_MARKER.format(1)}) and applying the rules above to each chunk on its own.\n"
+        )
+
+    return f"""Analyze this SOP document for compliance issues by comparing it with the regulatory context.
+For each issue found, provide the following EXACT format:
+
+ISSUE IN SOP DOCUMENT:
+[Quote the exact text from the SOP document that contains the issue]
+
+WHY ERROR:
+[Explain specifically why this is a compliance issue or violation]
+
+CITATION FROM CONTEXT:
+[Quote the specific regulatory text that identifies this as an issue, including document name and page number]
+
+If no issues are found, respond with exactly: "No compliance issues found in this section."
+{group_instructions}
+{sop_section}
+
+REGULATORY CONTEXT:
+{format_context(context_results.get('results', []))}
+"""
+
+def split_group_analysis(analysis, chunk_count):
+    """
+    Split a grouped LLM answer back into one analysis per SOP chunk.
+    If the headings cannot be matched, every chunk receives the full answer.
+    """
+    if chunk_count == 1:
+        return [analysis]
+
+    parts = GROUP_MARKER_PATTERN.split(analysis)
+    sections = {}
+    for i in range(1, len(parts) - 1, 2):
+        sections[int(parts[i])] = parts[i + 1].strip()
+
+    if set(sections) != set(range(1, chunk_count + 1)):
+        return [analysis] * chunk_count
+    return [sections[i] for i in range(1, chunk_count + 1)]
@@ -0,0 +1,287 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+import docx2txt
+from openai import AsyncOpenAI
+from .analysis import process_chunk_with_openai, context_chunk_ids, LLM_MODEL, PROMPT_TEMPLATE_VERSION
+from .config import AUDIT_JOB_DIR, BATCH_AUDIT_CONCURRENCY, BATCH_AUDIT_REQUESTS_PER_MINUTE, LLM_CACHE_PATH
+from .llm_cache import make_cache_key
+from .metrics import span, increment
+from .preprocess import chunk_sop_text
+from .retrieval import get_relevant_contexts
+
+PROGRESS_SAVE_EVERY = 10
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+_running_jobs = set()
+
+class RateLimiter:
+    """Spaces out acquisitions so at most requests_per_minute pass per minute, across all tasks."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def job_dir(job_id, job_root=AUDIT_JOB_DIR):
+    return os.path.join(job_root, job_id)
+
+def report_path(job_id, sop_name, job_root=AUDIT_JOB_DIR):
+    return os.path.join(job_dir(job_id, job_root), "reports", os.path.splitext(sop_name)[0] + ".json")
+
+def _write_json(path, data):
+    """Write JSON atomically so a crash never leaves a half-written state file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def is_valid_job_id(job_id):
+    """True if job_id has the form create_job generates (uuid4 hex), so it is safe in a path."""
+    return bool(JOB_ID_PATTERN.match(job_id))
+
+def load_job(job_id, job_root=AUDIT_JOB_DIR):
+    """Return the job state, or None if the job does not exist."""
+    if not is_valid_job_id(job_id):
+        return None
+    path = os.path.join(job_dir(job_id, job_root), "job.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_job(job, job_root=AUDIT_JOB_DIR):
+    job["updated_at"] = datetime.now(timezone.utc).isoformat()
+    _write_json(os.path.join(job_dir(job["job_id"], job_root), "job.json"), job)
+
+def create_job(sop_files, query, top_k=5, job_root=AUDIT_JOB_DIR):
+    """
+    Create a batch audit job from uploaded SOPs.
+
+    Args:
+        sop_files (list): (filename, DOCX bytes) pairs.
+        query (str): Audit query applied to every SOP.
+        top_k (int): Regulatory chunks retrieved per SOP chunk.
+
+    Returns:
+        dict: The initial job state.
+
+    Raises:
+        ValueError: If two SOPs share a filename, since inputs and reports are stored by name.
+    """
+    names = [os.path.basename(filename) for filename, _ in sop_files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate SOP filenames: {', '.join(duplicates)}")
+
+    job_id = uuid.uuid4().hex
+    directory = job_dir(job_id, job_root)
+    os.makedirs(os.path.join(directory, "inputs"))
+    os.makedirs(os.path.join(directory, "reports"))
+
+    sops = []
+    for filename, content in sop_files:
+        filename = os.path.basename(filename)
+        with open(os.path.join(directory, "inputs", filename), "wb") as f:
+            f.write(content)
+        sops.append({"name": filename, "status": "pending", "chunks": None})
+
+    job = {
+        "job_id": job_id,
+        "query": query,
+        "top_k": top_k,
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "sops": sops,
+        "progress": {"chunks": 0, "unique_pairs": 0, "pairs_done": 0, "tokens_used": 0},
+        "error": None
+    }
+    save_job(job, job_root)
+    return job
+
+def load_completed_pairs(job_id, job_root=AUDIT_JOB_DIR):
+    """Read the analyses already checkpointed by an earlier (possibly interrupted) run."""
+    path = os.path.join(job_dir(job_id, job_root), "results.jsonl")
+    completed = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of a run that was killed mid-write
+                    continue
+                completed[record["key"]] = record["analysis"]
+    return completed
+
+def chunk_sops(job_id, sop_names, job_root=AUDIT_JOB_DIR):
+    """Extract and chunk every SOP of the job. Returns (sop_name, chunk) pairs in order."""
+    sop_chunks = []
+    for name in sop_names:
+        with open(os.path.join(job_dir(job_id, job_root), "inputs", name), "rb") as f:
+            text = docx2txt.process(io.BytesIO(f.read()))
+        sop_chunks.extend((name, chunk) for chunk in chunk_sop_text(text, name))
+    return sop_chunks
+
+async def run_batch_audit(
+    job_id: str,
+    client: AsyncOpenAI,
+    faiss_path: str,
+    db_path: str,
+    concurrency: int = BATCH_AUDIT_CONCURRENCY,
+    requests_per_minute: int = BATCH_AUDIT_REQUESTS_PER_MINUTE,
+    job_root: str = AUDIT_JOB_DIR,
+    cache_path: str = LLM_CACHE_PATH,
+    tenant: str = None
+):
+    """
+    Run (or resume) a batch audit job against one tenant's corpus.
+
+    All pending SOPs are chunked up front and every chunk is retrieved in one batched
+    retrieval call. Identical (chunk text, retrieved context) pairs across files are
+    analyzed once. LLM calls are dispatched with a global concurrency cap and rate limit,
+    and each finished analysis is appended to results.jsonl so an interrupted job resumes
+    where it stopped. SOPs whose report already exists are skipped.
+
+    Returns:
+        dict: The final job state.
+    """
+    if job_id in _running_jobs:
+        raise RuntimeError(f"Batch audit job {job_id} is already running")
+    job = load_job(job_id, job_root)
+    if job is None:
+        raise FileNotFoundError(f"Batch audit job {job_id} not found")
+
+    _running_jobs.add(job_id)
+    results_path = os.path.join(job_dir(job_id, job_root), "results.jsonl")
+    try:
+        job["status"] = "running"
+        job["error"] = None
+        save_job(job, job_root)
+
+        pending = [sop["name"] for sop in job["sops"] if not os.path.exists(report_path(job_id, sop["name"], job_root))]
+        for sop in job["sops"]:
+            if sop["name"] not in pending:
+                sop["status"] = "done"
+
+        with span("batch_chunk"):
+            sop_chunks = await asyncio.to_thread(chunk_sops, job_id, pending, job_root)
+        with span("batch_retrieval"):
+            contexts = await asyncio.to_thread(
+                get_relevant_contexts,
+                [f"{job['query']} context: {chunk['text']}" for _, chunk in sop_chunks],
+                faiss_path,
+                db_path,
+                job["top_k"],
+                tenant=tenant
+            )
+
+        pairs = {}
+        pair_keys = []
+        for (_, chunk), context in zip(sop_chunks, contexts):
+            key = make_cache_key(LLM_MODEL, PROMPT_TEMPLATE_VERSION, chunk["text"], context_chunk_ids(context))
+            pairs.setdefault(key, (chunk, context))
+            pair_keys.append(key)
+
+        completed = load_completed_pairs(job_id, job_root)
+        job["progress"].update({
+            "chunks": len(sop_chunks),
+            "unique_pairs": len(pairs),
+            "pairs_done": sum(1 for key in pairs if key in completed)
+        })
+        for sop in job["sops"]:
+            if sop["name"] in pending:
+                sop["status"] = "running"
+                sop["chunks"] = sum(1 for name, _ in sop_chunks if name == sop["name"])
+        save_job(job, job_root)
+        increment("batch_audit_pairs_deduplicated_total", len(sop_chunks) - len(pairs))
+        logging.info(f"Batch audit {job_id}: {len(sop_chunks)} chunks, {len(pairs)} unique pairs, "
+                     f"{job['progress']['pairs_done']} already done")
+
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = RateLimiter(requests_per_minute)
+
+        async def analyze(key, chunk, context):
+            async with semaphore:
+                await limiter.wait()
+                analysis = await process_chunk_with_openai(
+                    chunk=chunk,
+                    query=job["query"],
+                    context_results={"results": context["results"]},
+                    client=client,
+                    db_path=db_path,
+                    cache_path=cache_path
+                )
+            if analysis["error"]:
+                # not checkpointed, so resuming the job retries this pair
+                increment("batch_audit_pairs_failed_total")
+                raise RuntimeError(analysis["analysis"])
+            completed[key] = analysis["analysis"]
+            with open(results_path, "a") as f:
+                f.write(json.dumps({"key": key, "analysis": analysis["analysis"]}) + "\n")
+            job["progress"]["pairs_done"] += 1
+            job["progress"]["tokens_used"] += analysis["tokens_used"]
+            if job["progress"]["pairs_done"] % PROGRESS_SAVE_EVERY == 0:
+                save_job(job, job_root)
+
+        with span("batch_analysis"):
+            outcomes = await asyncio.gather(*(
+                analyze(key, chunk, context)
+                for key, (chunk, context) in pairs.items()
+                if key not in completed
+            ), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if errors:
+            # finished pairs are checkpointed; resuming the job retries only the failed ones
+            raise Exception(f"{len(errors)} analyses failed, first error: {str(errors[0])}")
+
+        sop_reports = {}
+        for (name, chunk), context, key in zip(sop_chunks, contexts, pair_keys):
+            sop_reports.setdefault(name, []).append({
+                "chunk_text": chunk["text"],
+                "analysis_result": completed[key],
+                "context": [
+                    {"doc_name": r["doc_name"], "page_range": r["page_range"], "chunk_id": r["chunk_id"]}
+                    for r in context["results"]
+                ]
+            })
+        for sop in job["sops"]:
+            if sop["name"] not in pending:
+                continue
+            _write_json(report_path(job_id, sop["name"], job_root), {
+                "job_id": job_id,
+                "sop": sop["name"],
+                "query": job["query"],
+                "individual_results": sop_reports.get(sop["name"], [])
+            })
+            sop["status"] = "done"
+
+        job["status"] = "done"
+        save_job(job, job_root)
+        return job
+
+    except Exception as e:
+        logging.error(f"Batch audit {job_id} failed: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+        save_job(job, job_root)
+        raise
+    finally:
+        _running_jobs.discard(job_id)
@@ -1,28 +1,199 @@
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from neo4j import GraphDatabase
 import sqlite3
 import spacy
 import os
 import logging
-from .config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from .config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, RETRIEVAL_MODE, FAST_PATH_MIN_SIMILARITY, DEFAULT_TENANT_ID
+from .metrics import span, timed, increment
+from .embedding_service import get_embedding_service
+from .lexical import lexical_search
+from .shards import index_exists
+from .index_cache import search_index
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+embedding_model = get_embedding_service()
 nlp = spacy.load("en_core_web_lg")
 
-def get_relevant_context(query: str, faiss_path: str, db_path: str, top_k: int = 5) -> dict:
+RRF_K = 60
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """
+    Fuse several ranked lists of chunk ids with reciprocal rank fusion.
+    
+    Args:
+        ranked_lists (dict): Leg name -> list of chunk ids, best first.
+        k (int): RRF damping constant.
+    
+    Returns:
+        list: (chunk_id, fused_score, legs) tuples, best first.
+    """
+    scores = {}
+    legs = {}
+    for leg, chunk_ids in ranked_lists.items():
+        for rank, chunk_id in enumerate(chunk_ids):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+            legs.setdefault(chunk_id, []).append(leg)
+    fused = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return [(chunk_id, score, legs[chunk_id]) for chunk_id, score in fused]
+
+def load_chunk_metadata(cursor, chunk_ids):
+    """Fetch text, document name and page range for the given chunk ids only."""
+    chunk_ids = list(chunk_ids)
+    if not chunk_ids:
+        return {}
+    cursor.execute("SELECT chunk_id, text, doc_name, page_range FROM chunks WHERE chunk_id IN ({})".format(
+        ','.join('?' for _ in chunk_ids)), chunk_ids)
+    return {
+        row[0]: {
+            "text": row[1],
+            "doc_name": row[2],
+            "page_range": row[3]
+        } for row in cursor.fetchall()
+    }
+
+def graph_search(query, tenant=None):
+    """
+    Extract entities from the query with spaCy and collect chunks linked to them in Neo4j,
+    looking only at the tenant's entities.
+    
+    Returns:
+        list: (chunk_id, confidence, matched_entity) tuples, best first, without duplicates.
+    """
+    with span("spacy_ner"):
+        doc = nlp(query)
+    entities = [ent.text.lower() for ent in doc.ents]
+    if not entities:
+        increment("retrieval_queries_without_entities_total")
+        logger.debug("No entities found in the query")
+        return []
+    
+    graph_hits = []
+    seen_chunk_ids = set()
+    neo4j_driver = GraphDatabase.driver(
+        NEO4J_URI, 
+        auth=(NEO4J_USER, NEO4J_PASSWORD)
+    )
+    
+    try:
+        with neo4j_driver.session() as session:
+            for entity in entities:
+                cypher = """
+                MATCH (e:Entity)
+                WHERE coalesce(e.tenant, $default_tenant) = $tenant
+                  AND toLower(e.name) CONTAINS toLower($entity_name)
+                OPTIONAL MATCH (e)-[r:CONTEXT_LINK]-(related:Entity)
+                RETURN e.chunk_ids as source_chunks,
+                       related.chunk_ids as related_chunks,
+                       r.confidence as confidence,
+                       e.name as entity_name
+                ORDER BY r.confidence DESC
+                """
+                with span("neo4j_query"):
+                    records = list(session.run(
+                        cypher,
+                        entity_name=entity,
+                        tenant=tenant or DEFAULT_TENANT_ID,
+                        default_tenant=DEFAULT_TENANT_ID
+                    ))
+                
+                for record in records:
+                    confidence = float(record["confidence"]) if record["confidence"] else 0.0
+                    for chunk_ids in (record["source_chunks"], record["related_chunks"]):
+                        for chunk_id in chunk_ids or []:
+                            if chunk_id not in seen_chunk_ids:
+                                seen_chunk_ids.add(chunk_id)
+                                graph_hits.append((chunk_id, confidence, entity))
+    except Exception as e:
+        raise Exception(f"Error in Neo4j processing: {str(e)}")
+    finally:
+        neo4j_driver.close()
+    
+    graph_hits.sort(key=lambda x: x[1], reverse=True)
+    return graph_hits
+
+def is_confident(vector_hits, lexical_hits, min_similarity=FAST_PATH_MIN_SIMILARITY):
+    """
+    The vector and lexical legs are confident when the best vector hit is similar enough
+    and the best lexical hit is also among the vector hits.
+    """
+    if not vector_hits or not lexical_hits:
+        return False
+    best_similarity = vector_hits[0][1]
+    vector_ids = {chunk_id for chunk_id, _ in vector_hits}
+    return best_similarity >= min_similarity and lexical_hits[0][0] in vector_ids
+
+def fuse_legs(cursor, query, vector_hits, top_k, mode, tenant=None):
+    """
+    Run the lexical and (unless skipped) graph legs for a query, fuse them with the
+    given vector hits and load the metadata of the fused chunks.
+    
+    Returns:
+        list: Result dicts, best first, at most top_k and without duplicate texts.
     """
-    Retrieve relevant context for a query using hybrid retrieval (vector + graph based).
+    with span("lexical_search"):
+        lexical_hits = lexical_search(cursor.connection, query, top_k)
+    
+    graph_hits = []
+    skip_graph = mode == "fast" or (mode == "auto" and is_confident(vector_hits, lexical_hits))
+    if skip_graph:
+        increment("retrieval_graph_skipped_total")
+    else:
+        graph_hits = graph_search(query, tenant)
+    
+    fused = reciprocal_rank_fusion({
+        "vector": [chunk_id for chunk_id, _ in vector_hits],
+        "lexical": [chunk_id for chunk_id, _ in lexical_hits],
+        "graph": [chunk_id for chunk_id, _, _ in graph_hits],
+    })
+    with span("load_metadata"):
+        chunk_metadata = load_chunk_metadata(cursor, [chunk_id for chunk_id, _, _ in fused])
+    
+    matched_entities = {chunk_id: entity for chunk_id, _, entity in graph_hits}
+    seen_texts = set()
+    combined_results = []
+    for chunk_id, score, legs in fused:
+        metadata = chunk_metadata.get(chunk_id)
+        if metadata is None or metadata["text"] in seen_texts:
+            continue
+        seen_texts.add(metadata["text"])
+        result = {
+            "text": metadata["text"],
+            "doc_name": metadata["doc_name"],
+            "page_range": metadata["page_range"],
+            "score": score,
+            "chunk_id": chunk_id,
+            "sources": legs
+        }
+        if chunk_id in matched_entities:
+            result["matched_entity"] = matched_entities[chunk_id]
+        combined_results.append(result)
+        if len(combined_results) == top_k:
+            break
+    
+    increment("retrieval_queries_total", mode=mode)
+    increment("retrieval_results_total", len(combined_results))
+    return combined_results
+
+@timed("get_relevant_context")
+def get_relevant_context(query: str, faiss_path: str, db_path: str, top_k: int = 5,
+                         mode: str = None, tenant: str = None) -> dict:
+    """
+    Retrieve relevant context for a query using hybrid retrieval (vector + lexical + graph based).
+    Results from the legs are combined with reciprocal rank fusion.
     
     Args:
         query (str): The search query
         faiss_path (str): Path to the FAISS index file
         db_path (str): Path to the SQLite database
         top_k (int): Number of top results to return from vector search
+        mode (str): "full", "fast" or "auto" (defaults to RETRIEVAL_MODE). "fast" skips
+            spaCy NER and the graph hop; "auto" skips them when the vector and lexical
+            legs already agree with high confidence.
+        tenant (str): Tenant whose graph namespace is searched (defaults to DEFAULT_TENANT_ID)
     
     Returns:
         dict: Dictionary containing query and results with metadata
@@ -31,114 +202,63 @@ def get_relevant_context(query: str, faiss_path: str, db_path: str, top_k: int =
         FileNotFoundError: If FAISS index or database file not found
         Exception: For other errors during retrieval
     """
+    return get_relevant_contexts([query], faiss_path, db_path, top_k, mode, tenant=tenant)[0]
+
+@timed("get_relevant_contexts")
+def get_relevant_contexts(queries, faiss_path: str, db_path: str, top_k: int = 5,
+                          mode: str = None, batch_size: int = 64, tenant: str = None) -> list:
+    """
+    Batched variant of get_relevant_context: the FAISS index is loaded once, all queries
+    are embedded in batched forward passes and searched with one FAISS call, and the
+    lexical and graph legs share a single database connection. Indexes come from the
+    LRU index cache; a sharded index is searched by scattering the queries to its shard
+    workers and merging their top-k.
+    
+    Args:
+        queries (list): Search queries
+        faiss_path (str): Path to the FAISS index file
+        db_path (str): Path to the SQLite database
+        top_k (int): Number of results per query
+        mode (str): Retrieval mode, see get_relevant_context
+        batch_size (int): Embedding batch size
+        tenant (str): Tenant whose graph namespace is searched
+    
+    Returns:
+        list: One {"query", "results"} dict per query, in input order
+    """
+    mode = mode or RETRIEVAL_MODE
+    queries = list(queries)
     try:
-        if not os.path.exists(faiss_path):
+        if not index_exists(faiss_path):
             raise FileNotFoundError(f"FAISS index not found at: {faiss_path}")
         if not os.path.exists(db_path):
             raise FileNotFoundError(f"SQLite database not found at: {db_path}")
+        if not queries:
+            return []
             
-        faiss_index = faiss.read_index(faiss_path)
+        with span("minilm_embed"):
+            query_embs = embedding_model.encode(queries, batch_size=batch_size, convert_to_numpy=True)
+        with search_index(faiss_path, db_path) as faiss_index, span("vector_search"):
+            distances, indices = faiss_index.search(query_embs, top_k)
         
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
-        cursor.execute("SELECT chunk_id, text, doc_name, page_range FROM chunks")
-        chunk_metadata = {
-            row[0]: {
-                "text": row[1],
-                "doc_name": row[2],
-                "page_range": row[3]
-            } for row in cursor.fetchall()
-        }
-        conn.close()
-        
-        query_emb = embedding_model.encode([query], convert_to_numpy=True)
-        distances, indices = faiss_index.search(query_emb, top_k)
-        vector_results = []
-        for idx in indices[0]:
-            if idx in chunk_metadata:
-                vector_results.append({
-                    "text": chunk_metadata[idx]["text"],
-                    "doc_name": chunk_metadata[idx]["doc_name"],
-                    "page_range": chunk_metadata[idx]["page_range"],
-                    "score": float(distances[0][list(indices[0]).index(idx)])
+        contexts = []
+        try:
+            for query, row_indices, row_distances in zip(queries, indices, distances):
+                vector_hits = [
+                    (int(idx), float(distance))
+                    for idx, distance in zip(row_indices, row_distances)
+                    if idx != -1
+                ]
+                contexts.append({
+                    "query": query,
+                    "results": fuse_legs(cursor, query, vector_hits, top_k, mode, tenant)
                 })
+        finally:
+            conn.close()
         
-        doc = nlp(query)
-        entities = [ent.text.lower() for ent in doc.ents]
-        graph_results = []
-        seen_chunk_ids = set()
-        
-        if entities:
-            neo4j_driver = GraphDatabase.driver(
-                NEO4J_URI, 
-                auth=(NEO4J_USER, NEO4J_PASSWORD)
-            )
-            
-            try:
-                with neo4j_driver.session() as session:
-                    for entity in entities:
-                        query = """
-                        MATCH (e:Entity)
-                        WHERE toLower(e.name) CONTAINS toLower($entity_name)
-                        OPTIONAL MATCH (e)-[r:CONTEXT_LINK]-(related:Entity)
-                        RETURN e.chunk_ids as source_chunks,
-                               related.chunk_ids as related_chunks,
-                               r.confidence as confidence,
-                               e.name as entity_name
-                        ORDER BY r.confidence DESC
-                        """
-                        results = session.run(query, entity_name=entity)
-                        
-                        for record in results:
-                            source_chunks = record["source_chunks"]
-                            if source_chunks:
-                                for chunk_id in source_chunks:
-                                    if chunk_id in chunk_metadata and chunk_id not in seen_chunk_ids:
-                                        seen_chunk_ids.add(chunk_id)
-                                        graph_results.append({
-                                            "text": chunk_metadata[chunk_id]["text"],
-                                            "doc_name": chunk_metadata[chunk_id]["doc_name"],
-                                            "page_range": chunk_metadata[chunk_id]["page_range"],
-                                            "score": float(record["confidence"]) if record["confidence"] else 0.0,
-                                            "matched_entity": entity,
-                                            "chunk_id": chunk_id
-                                        })
-                            
-                            related_chunks = record["related_chunks"]
-                            if related_chunks:
-                                for chunk_id in related_chunks:
-                                    if chunk_id in chunk_metadata and chunk_id not in seen_chunk_ids:
-                                        seen_chunk_ids.add(chunk_id)
-                                        graph_results.append({
-                                            "text": chunk_metadata[chunk_id]["text"],
-                                            "doc_name": chunk_metadata[chunk_id]["doc_name"],
-                                            "page_range": chunk_metadata[chunk_id]["page_range"],
-                                            "score": float(record["confidence"]) if record["confidence"] else 0.0,
-                                            "matched_entity": entity,
-                                            "chunk_id": chunk_id
-                                        })
-            except Exception as e:
-                raise Exception(f"Error in Neo4j processing: {str(e)}")
-            finally:
-                neo4j_driver.close()
-        else:
-            with open("debug_graph.txt", "a") as f:
-                f.write("No entities found in the query\n")
-        
-        seen_texts = set()
-        combined_results = []
-        
-        for result in vector_results + graph_results:
-            if result["text"] not in seen_texts:
-                seen_texts.add(result["text"])
-                combined_results.append(result)
-        
-        combined_results.sort(key=lambda x: x["score"], reverse=True)
-        
-        return {
-            "query": query,
-            "results": combined_results[:top_k]
-        }
+        return contexts
         
     except Exception as e:
         raise Exception(f"Error during retrieval: {str(e)}")
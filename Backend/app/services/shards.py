@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import faiss
+import numpy as np
+from .config import SHARD_SEARCH_TIMEOUT
+from .metrics import span, increment
+
+MANIFEST_NAME = "manifest.json"
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+def index_write_lock(faiss_path):
+    """
+    Lock serializing read-modify-write updates of the index at faiss_path (monolithic or
+    sharded), so concurrent ingests cannot overwrite each other's vectors.
+    """
+    with _write_locks_guard:
+        return _write_locks.setdefault(os.path.abspath(faiss_path), threading.Lock())
+
+def shard_dir(faiss_path):
+    """Directory holding the shards of the index at faiss_path."""
+    return faiss_path + ".shards"
+
+def load_manifest(faiss_path):
+    """Return the shard manifest ({"shards": [...], "dimension": d}) or None if the index is not sharded."""
+    path = os.path.join(shard_dir(faiss_path), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def is_sharded(faiss_path):
+    return load_manifest(faiss_path) is not None
+
+def index_exists(faiss_path):
+    """True if a monolithic or sharded vector index exists for faiss_path."""
+    return os.path.exists(faiss_path) or is_sharded(faiss_path)
+
+def _save_manifest(faiss_path, manifest):
+    path = os.path.join(shard_dir(faiss_path), MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def shard_path(faiss_path, name):
+    return os.path.join(shard_dir(faiss_path), f"{name}.faiss")
+
+def _shard_seed(name):
+    return np.uint64(int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "little"))
+
+def _mix64(values):
+    """splitmix64 finalizer over a uint64 array."""
+    with np.errstate(over="ignore"):
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (values ^ (values >> np.uint64(31))) & _MASK64
+
+def assign_shards(chunk_ids, shard_names):
+    """
+    Rendezvous (highest random weight) hashing of chunk ids onto shards. Each id goes to
+    the shard with the highest hash of (shard, id), so adding a shard only moves the ids
+    that the new shard wins, and removing one only moves the ids it held.
+
+    Returns:
+        np.ndarray: Index into shard_names for every chunk id.
+    """
+    ids = np.asarray(chunk_ids, dtype=np.int64).astype(np.uint64)
+    weights = np.stack([_mix64(ids ^ _shard_seed(name)) for name in shard_names])
+    return np.argmax(weights, axis=0)
+
+def _read_shard(path, dimension):
+    if os.path.exists(path):
+        return faiss.read_index(path)
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+def _write_shard(index, path):
+    # Workers reload shards by mtime; replace atomically so they never see a partial file.
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+def index_contents(index):
+    """Return (vectors, ids) stored in an id-mapped flat index."""
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    if not len(ids):
+        return np.zeros((0, index.d), dtype=np.float32), ids
+    return index.index.reconstruct_n(0, index.ntotal), ids
+
+def key_legacy_index(faiss_path, db_path):
+    """
+    Key a legacy monolithic index (vectors stored by position, without chunk_id ids) by
+    chunk_id in place, without re-encoding. Chunks were always appended to the index in
+    chunk_id order, so position i holds the i-th stored chunk.
+
+    Returns:
+        The id-mapped index now on disk.
+
+    Raises:
+        ValueError: If the index holds more vectors than there are stored chunks.
+    """
+    with index_write_lock(faiss_path):
+        index = faiss.read_index(faiss_path)
+        if hasattr(index, "id_map"):
+            return index
+        conn = sqlite3.connect(db_path)
+        try:
+            chunk_ids = [row[0] for row in conn.execute("SELECT chunk_id FROM chunks ORDER BY chunk_id")]
+        finally:
+            conn.close()
+        if index.ntotal > len(chunk_ids):
+            raise ValueError(
+                f"Legacy index {faiss_path} has {index.ntotal} vectors but only {len(chunk_ids)} chunks "
+                f"are stored; rebuild the index"
+            )
+        if index.ntotal < len(chunk_ids):
+            logging.warning(f"Legacy index {faiss_path} is missing the vectors of the last "
+                            f"{len(chunk_ids) - index.ntotal} chunks")
+        keyed = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+        if index.ntotal:
+            keyed.add_with_ids(index.reconstruct_n(0, index.ntotal),
+                               np.array(chunk_ids[:index.ntotal], dtype=np.int64))
+        _write_shard(keyed, faiss_path)
+        increment("legacy_indexes_keyed_total")
+        logging.info(f"Keyed legacy index {faiss_path} by chunk_id ({index.ntotal} vectors)")
+        return keyed
+
+def add_to_shards(embeddings, chunk_ids, faiss_path):
+    """Route vectors to their shards and append them, keyed by chunk_id."""
+    manifest = load_manifest(faiss_path)
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    targets = assign_shards(chunk_ids, manifest["shards"])
+    for position, name in enumerate(manifest["shards"]):
+        mask = targets == position
+        if not mask.any():
+            continue
+        path = shard_path(faiss_path, name)
+        index = _read_shard(path, manifest["dimension"])
+        index.add_with_ids(embeddings[mask], chunk_ids[mask])
+        _write_shard(index, path)
+    increment("shard_vectors_added_total", len(chunk_ids))
+
+def reshard(faiss_path, num_shards):
+    """
+    Split the monolithic index at faiss_path into num_shards shards, or change the number
+    of shards of an already sharded index. With rendezvous hashing only the vectors whose
+    shard changes are moved; nothing is re-encoded. Holds the index write lock throughout.
+
+    Returns:
+        dict: Shard count, vectors moved and vectors per shard.
+    """
+    if num_shards < 1:
+        raise ValueError("num_shards must be at least 1")
+    with index_write_lock(faiss_path):
+        return _reshard(faiss_path, num_shards)
+
+def _reshard(faiss_path, num_shards):
+    new_names = [f"shard-{i}" for i in range(num_shards)]
+    manifest = load_manifest(faiss_path)
+    os.makedirs(shard_dir(faiss_path), exist_ok=True)
+
+    if manifest is None:
+        if not os.path.exists(faiss_path):
+            raise FileNotFoundError(f"FAISS index not found at: {faiss_path}")
+        index = faiss.read_index(faiss_path)
+        if not hasattr(index, "id_map"):
+            raise ValueError("Index is not keyed by chunk_id; re-ingest or rebuild it before sharding")
+        sources = {None: index}
+        dimension = index.d
+        old_names = []
+    else:
+        dimension = manifest["dimension"]
+        old_names = manifest["shards"]
+        sources = {name: _read_shard(shard_path(faiss_path, name), dimension) for name in old_names}
+
+    shards = {name: (sources[name] if name in sources else _read_shard(shard_path(faiss_path, name), dimension))
+              for name in new_names}
+    moved = 0
+    with span("reshard"):
+        for source_name, source in sources.items():
+            vectors, ids = index_contents(source)
+            if not len(ids):
+                continue
+            targets = assign_shards(ids, new_names)
+            for position, name in enumerate(new_names):
+                if name == source_name:
+                    continue
+                mask = targets == position
+                if mask.any():
+                    shards[name].add_with_ids(vectors[mask], ids[mask])
+                    moved += int(mask.sum())
+            if source_name in shards:
+                stay = targets == new_names.index(source_name)
+                if not stay.all():
+                    source.remove_ids(faiss.IDSelectorBatch(ids[~stay]))
+
+    for name, index in shards.items():
+        _write_shard(index, shard_path(faiss_path, name))
+    _save_manifest(faiss_path, {"shards": new_names, "dimension": dimension})
+    for name in old_names:
+        if name not in shards and os.path.exists(shard_path(faiss_path, name)):
+            os.remove(shard_path(faiss_path, name))
+    if manifest is None:
+        os.remove(faiss_path)
+
+    increment("shard_vectors_moved_total", moved)
+    logging.info(f"Resharded {faiss_path} into {num_shards} shards, moved {moved} vectors")
+    return {
+        "num_shards": num_shards,
+        "vectors_moved": moved,
+        "vectors_per_shard": {name: int(index.ntotal) for name, index in shards.items()}
+    }
+
+# --- shard worker processes ---
+
+_worker_state = {}
+
+def _init_shard_worker(path, dimension):
+    faiss.omp_set_num_threads(1)
+    _worker_state.update(path=path, dimension=dimension, mtime=None, index=None)
+
+def _search_shard(query_embs, top_k):
+    """Runs inside a shard worker: search the shard, reloading it when the file changed."""
+    path = _worker_state["path"]
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if mtime != _worker_state["mtime"]:
+        _worker_state["index"] = faiss.read_index(path) if mtime is not None else None
+        _worker_state["mtime"] = mtime
+    index = _worker_state["index"]
+    if index is None or index.ntotal == 0:
+        return (np.full((len(query_embs), top_k), -np.inf, dtype=np.float32),
+                np.full((len(query_embs), top_k), -1, dtype=np.int64))
+    return index.search(query_embs, top_k)
+
+class ShardedIndex:
+    """
+    Scatter-gather search over index shards, each served by its own worker process.
+    search() has the same signature and result layout as a FAISS index.
+    """
+
+    def __init__(self, faiss_path, manifest):
+        self.shards = list(manifest["shards"])
+        context = multiprocessing.get_context("spawn")
+        self.executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_shard_worker,
+                initargs=(shard_path(faiss_path, name), manifest["dimension"])
+            )
+            for name in self.shards
+        ]
+
+    def search(self, query_embs, top_k):
+        query_embs = np.ascontiguousarray(query_embs, dtype=np.float32)
+        futures = [executor.submit(_search_shard, query_embs, top_k) for executor in self.executors]
+        results = [future.result(timeout=SHARD_SEARCH_TIMEOUT) for future in futures]
+
+        distances = np.concatenate([d for d, _ in results], axis=1)
+        indices = np.concatenate([i for _, i in results], axis=1)
+        distances[indices == -1] = -np.inf
+        best = np.argsort(-distances, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(distances, best, axis=1), np.take_along_axis(indices, best, axis=1)
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
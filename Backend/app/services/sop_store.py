@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from .config import SOP_DB_PATH
+from .analysis import ANALYSIS_ERROR_PREFIX
+
+def create_sop_db(db_path=SOP_DB_PATH):
+    """Create the SOP library tables if they do not exist yet."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sops (
+            sop_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sop_versions (
+            version_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sop_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (sop_id, version)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sop_chunks (
+            version_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (version_id, position)
+        )
+    """)
+    # chunk embeddings were stored by earlier versions but never read
+    cursor.execute("PRAGMA table_info(sop_chunks)")
+    if "embedding" in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE sop_chunks DROP COLUMN embedding")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sop_chunks_hash ON sop_chunks (content_hash)
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sop_audit_results (
+            version_id INTEGER NOT NULL,
+            query TEXT NOT NULL,
+            top_k INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            corpus_fingerprint TEXT NOT NULL,
+            analysis TEXT NOT NULL,
+            context TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version_id, query, top_k, position)
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+_initialized_dbs = set()
+
+def _connect(db_path):
+    if db_path not in _initialized_dbs:
+        create_sop_db(db_path)
+        _initialized_dbs.add(db_path)
+    return sqlite3.connect(db_path)
+
+def content_hash(text):
+    """Hash identifying a chunk by its content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_or_create_sop(name, db_path=SOP_DB_PATH):
+    """Return the sop_id for an SOP name, creating the SOP if needed."""
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO sops (name) VALUES (?)", (name,))
+    cursor.execute("SELECT sop_id FROM sops WHERE name = ?", (name,))
+    sop_id = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return sop_id
+
+def sop_exists(sop_id, db_path=SOP_DB_PATH):
+    if not os.path.exists(db_path):
+        return False
+
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sops WHERE sop_id = ?", (sop_id,))
+    exists = cursor.fetchone() is not None
+    conn.close()
+    return exists
+
+def list_sops(db_path=SOP_DB_PATH):
+    """List all SOPs with their latest version number."""
+    if not os.path.exists(db_path):
+        return []
+
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT s.sop_id, s.name, s.created_at, MAX(v.version)
+        FROM sops s
+        LEFT JOIN sop_versions v ON v.sop_id = s.sop_id
+        GROUP BY s.sop_id
+        ORDER BY s.name
+    """)
+    sops = [
+        {"sop_id": row[0], "name": row[1], "created_at": row[2], "latest_version": row[3]}
+        for row in cursor.fetchall()
+    ]
+    conn.close()
+    return sops
+
+def list_versions(sop_id, db_path=SOP_DB_PATH):
+    """List the stored versions of an SOP with their chunk counts."""
+    if not os.path.exists(db_path):
+        return []
+
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT v.version_id, v.version, v.filename, v.created_at, COUNT(c.position)
+        FROM sop_versions v
+        LEFT JOIN sop_chunks c ON c.version_id = v.version_id
+        WHERE v.sop_id = ?
+        GROUP BY v.version_id
+        ORDER BY v.version
+    """, (sop_id,))
+    versions = [
+        {"version_id": row[0], "version": row[1], "filename": row[2], "created_at": row[3], "chunk_count": row[4]}
+        for row in cursor.fetchall()
+    ]
+    conn.close()
+    return versions
+
+def get_version(sop_id, version=None, db_path=SOP_DB_PATH):
+    """Return (version_id, version) for a given version number, or the latest one. None if absent."""
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    if version is None:
+        cursor.execute("""
+            SELECT version_id, version FROM sop_versions
+            WHERE sop_id = ? ORDER BY version DESC LIMIT 1
+        """, (sop_id,))
+    else:
+        cursor.execute("""
+            SELECT version_id, version FROM sop_versions
+            WHERE sop_id = ? AND version = ?
+        """, (sop_id, version))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def add_version(sop_id, filename, text, chunks, db_path=SOP_DB_PATH):
+    """
+    Store a new version of an SOP with its extracted text and chunks.
+
+    Args:
+        sop_id (int): SOP the version belongs to.
+        filename (str): Uploaded file name.
+        text (str): Extracted text of the document.
+        chunks (list): Chunk dicts in document order.
+
+    Returns:
+        tuple: (version_id, version)
+    """
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM sop_versions WHERE sop_id = ?", (sop_id,))
+    version = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO sop_versions (sop_id, version, filename, text)
+        VALUES (?, ?, ?, ?)
+    """, (sop_id, version, filename, text))
+    version_id = cursor.lastrowid
+    cursor.executemany("""
+        INSERT INTO sop_chunks (version_id, position, content_hash, text)
+        VALUES (?, ?, ?, ?)
+    """, [
+        (version_id, position, content_hash(chunk["text"]), chunk["text"])
+        for position, chunk in enumerate(chunks)
+    ])
+    conn.commit()
+    conn.close()
+    logging.info(f"Stored version {version} of SOP {sop_id} with {len(chunks)} chunks")
+    return version_id, version
+
+def load_version_chunks(version_id, db_path=SOP_DB_PATH):
+    """Return the chunks of a stored version in document order."""
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT position, content_hash, text FROM sop_chunks
+        WHERE version_id = ? ORDER BY position
+    """, (version_id,))
+    chunks = [
+        {"position": row[0], "content_hash": row[1], "text": row[2]}
+        for row in cursor.fetchall()
+    ]
+    conn.close()
+    return chunks
+
+def load_previous_hashes(sop_id, version, db_path=SOP_DB_PATH):
+    """Return the set of chunk hashes of the version preceding the given one."""
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.content_hash FROM sop_chunks c
+        JOIN sop_versions v ON v.version_id = c.version_id
+        WHERE v.sop_id = ? AND v.version = (
+            SELECT MAX(version) FROM sop_versions WHERE sop_id = ? AND version < ?
+        )
+    """, (sop_id, sop_id, version))
+    hashes = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return hashes
+
+def find_reusable_results(sop_id, query, top_k, corpus_fingerprint, db_path=SOP_DB_PATH):
+    """
+    Collect stored audit results of any version of the SOP for the same query, top_k and
+    regulatory corpus, keyed by chunk content hash. Newer versions win. Failed analyses
+    are never reused, so those chunks are analyzed again.
+    """
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT r.content_hash, r.analysis, r.context
+        FROM sop_audit_results r
+        JOIN sop_versions v ON v.version_id = r.version_id
+        WHERE v.sop_id = ? AND r.query = ? AND r.top_k = ? AND r.corpus_fingerprint = ?
+            AND r.analysis NOT LIKE ?
+        ORDER BY v.version DESC, r.created_at DESC
+    """, (sop_id, query, top_k, corpus_fingerprint, ANALYSIS_ERROR_PREFIX + "%"))
+    results = {}
+    for chunk_hash, analysis, context in cursor.fetchall():
+        if chunk_hash not in results:
+            results[chunk_hash] = {"analysis": analysis, "context": json.loads(context)}
+    conn.close()
+    return results
+
+def store_audit_results(version_id, query, top_k, corpus_fingerprint, results, db_path=SOP_DB_PATH):
+    """
+    Persist the audit results of a version.
+
+    Args:
+        results (list): Dicts with position, content_hash, analysis and context.
+    """
+    conn = _connect(db_path)
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT OR REPLACE INTO sop_audit_results
+            (version_id, query, top_k, position, content_hash, corpus_fingerprint, analysis, context)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (version_id, query, top_k, r["position"], r["content_hash"], corpus_fingerprint,
+         r["analysis"], json.dumps(r["context"]))
+        for r in results
+    ])
+    conn.commit()
+    conn.close()
+
+def corpus_fingerprint(chunks_db_path):
+    """
+    Identify the state of the regulatory corpus, so stored audit results are only
+    reused while no regulations have been added or removed.
+    """
+    conn = sqlite3.connect(chunks_db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*), COALESCE(MAX(chunk_id), 0) FROM chunks")
+    count, max_id = cursor.fetchone()
+    conn.close()
+    return f"{count}:{max_id}"
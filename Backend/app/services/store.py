@@ -1,27 +1,37 @@
 import logging
 import os
-from sentence_transformers import SentenceTransformer
 import faiss
 import json
-from .preprocess import preprocess_documents
+import numpy as np
+from .preprocess import preprocess_documents, sentence_spans
 import sqlite3
-from transformers import pipeline
+from .metrics import span, timed, increment
+from .config import STREAM_FLUSH_VECTORS
+from .inference import get_summarizer
+from .embedding_service import get_embedding_service
+from .lexical import ensure_fts_index
+from .shards import is_sharded, add_to_shards, index_write_lock, index_contents
 
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-summarizer = pipeline("summarization", model="facebook/bart-large-cnn", device=-1)
+embedding_model = get_embedding_service()
+summarizer = get_summarizer()
 
 def summarize_chunk(text):
     """Generate a short summary of the chunk text."""
     if len(text.split()) > 1024:
         text = " ".join(text.split()[:1024])
     try:
-        summary = summarizer(text, max_length=30, min_length=10, do_sample=False)[0]['summary_text']
+        with span("bart_summarize"):
+            summary = summarizer(text, max_length=30, min_length=10, do_sample=False)[0]['summary_text']
     except Exception as e:
         logging.warning(f"Failed to summarize chunk: {e}. Using truncated text as fallback.")
         summary = text[:100]
     return summary
 
 def create_metadata_db(db_path="chunks.db"):
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     cursor.execute("""
@@ -30,7 +40,44 @@ def create_metadata_db(db_path="chunks.db"):
             text TEXT NOT NULL,
             doc_name TEXT NOT NULL,
             page_range TEXT NOT NULL,
-            summary TEXT
+            summary TEXT,
+            source_id TEXT
+        )
+    """)
+    
+    cursor.execute("PRAGMA table_info(chunks)")
+    if "source_id" not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE chunks ADD COLUMN source_id TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (doc_name, source_id)")
+    
+    # One row per clause id of a chunk, so grouped chunks can be matched clause by clause.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunk_clauses'")
+    backfill_clauses = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_clauses (
+            doc_name TEXT NOT NULL,
+            source_id TEXT NOT NULL,
+            chunk_id INTEGER NOT NULL,
+            PRIMARY KEY (doc_name, source_id, chunk_id)
+        )
+    """)
+    if backfill_clauses:
+        # Chunks stored before this table existed carry their clause ids comma-joined in source_id.
+        cursor.execute("SELECT chunk_id, doc_name, source_id FROM chunks WHERE source_id IS NOT NULL")
+        cursor.executemany("INSERT OR IGNORE INTO chunk_clauses (doc_name, source_id, chunk_id) VALUES (?, ?, ?)", [
+            (doc_name, clause_id, chunk_id)
+            for chunk_id, doc_name, source_id in cursor.fetchall()
+            for clause_id in source_id.split(",") if clause_id
+        ])
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_sentences (
+            chunk_id INTEGER NOT NULL,
+            sentence_index INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            embedding BLOB NOT NULL,
+            PRIMARY KEY (chunk_id, sentence_index)
         )
     """)
     
@@ -48,45 +95,214 @@ def create_metadata_db(db_path="chunks.db"):
     """)
     
     conn.commit()
+    ensure_fts_index(conn)
     conn.close()
 
-def store_chunks_in_vector_db(regulatory_chunks, faiss_output_path="regulatory_index.faiss", 
-                            db_path="chunks.db"):
-    if not os.path.exists(db_path):
-        create_metadata_db(db_path)
-    
+def embed_chunks(regulatory_chunks):
+    """Encode chunk texts with MiniLM for the vector index."""
     chunk_texts = [chunk["text"] for chunk in regulatory_chunks]
-    embeddings = embedding_model.encode(chunk_texts, convert_to_numpy=True)
+    with span("minilm_embed"):
+        embeddings = embedding_model.encode(chunk_texts, convert_to_numpy=True)
+    return embeddings.astype(np.float32)
+
+def embed_chunk_sentences(regulatory_chunks):
+    """
+    Split each chunk into sentences and encode them, so prompts can later be trimmed
+    to the sentences most relevant to an SOP chunk without re-encoding.
+    
+    Returns:
+        list: One list per chunk of (sentence_index, start, end, embedding) tuples.
+    """
+    spans_per_chunk = [sentence_spans(chunk["text"]) for chunk in regulatory_chunks]
+    sentence_texts = [
+        chunk["text"][start:end]
+        for chunk, spans in zip(regulatory_chunks, spans_per_chunk)
+        for start, end in spans
+    ]
+    if not sentence_texts:
+        return [[] for _ in regulatory_chunks]
+    
+    with span("minilm_embed"):
+        sentence_embeddings = embedding_model.encode(sentence_texts, convert_to_numpy=True).astype(np.float32)
     
-    dimension = embeddings.shape[1]
-    faiss_index = faiss.IndexFlatIP(dimension)
-    faiss_index.add(embeddings)
-    faiss.write_index(faiss_index, faiss_output_path)
+    chunk_sentences = []
+    next_embedding = 0
+    for spans in spans_per_chunk:
+        sentences = []
+        for sentence_index, (start, end) in enumerate(spans):
+            sentences.append((sentence_index, start, end, sentence_embeddings[next_embedding]))
+            next_embedding += 1
+        chunk_sentences.append(sentences)
+    return chunk_sentences
+
+def summarize_chunks(regulatory_chunks):
+    """Generate a BART summary for every chunk."""
+    summaries = []
+    for i, chunk in enumerate(regulatory_chunks):
+        summaries.append(summarize_chunk(chunk["text"]))
+        if (i + 1) % 10 == 0:
+            logging.debug(f"Summarized {i + 1}/{len(regulatory_chunks)} chunks")
+    return summaries
+
+def rebuild_faiss_index(faiss_output_path, db_path):
+    """
+    Re-encode every stored chunk into a new id-mapped FAISS index whose ids are chunk_ids.
+    Used to migrate indexes written before vectors were keyed by chunk_id.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chunk_id, text FROM chunks ORDER BY chunk_id")
+    rows = cursor.fetchall()
+    conn.close()
+    
+    logging.info(f"Rebuilding FAISS index at {faiss_output_path} from {len(rows)} stored chunks")
+    embeddings = embed_chunks([{"text": text} for _, text in rows])
+    faiss_index = faiss.IndexIDMap2(faiss.IndexFlatIP(embedding_model.get_sentence_embedding_dimension()))
+    if rows:
+        faiss_index.add_with_ids(embeddings, np.array([chunk_id for chunk_id, _ in rows], dtype=np.int64))
+    write_faiss_index(faiss_index, faiss_output_path)
+    return faiss_index
+
+def write_faiss_index(faiss_index, faiss_output_path):
+    # Replace atomically so searches never load a partially written file.
+    tmp_path = faiss_output_path + ".tmp"
+    faiss.write_index(faiss_index, tmp_path)
+    os.replace(tmp_path, faiss_output_path)
+
+def add_to_faiss_index(embeddings, chunk_ids, faiss_output_path, db_path):
+    """
+    Append vectors to the FAISS index on disk, keyed by their chunk_ids.
+    Creates the index if it does not exist yet. Sharded indexes route each vector to its shard.
+    Concurrent writers to the same index are serialized by its write lock.
+    """
+    with index_write_lock(faiss_output_path):
+        if is_sharded(faiss_output_path):
+            add_to_shards(embeddings, chunk_ids, faiss_output_path)
+            return
+        if os.path.exists(faiss_output_path):
+            faiss_index = faiss.read_index(faiss_output_path)
+            if not hasattr(faiss_index, "id_map"):
+                # Legacy index without chunk_id keys; the new rows are already in the database.
+                rebuild_faiss_index(faiss_output_path, db_path)
+                return
+        else:
+            faiss_index = faiss.IndexIDMap2(faiss.IndexFlatIP(embeddings.shape[1]))
+        
+        faiss_index.add_with_ids(embeddings, np.array(chunk_ids, dtype=np.int64))
+        write_faiss_index(faiss_index, faiss_output_path)
     logging.debug(f"Saved FAISS index to {faiss_output_path}")
+
+def new_pending_index():
+    """Empty in-memory index collecting the vectors of a bulk load until flush_pending_index."""
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(embedding_model.get_sentence_embedding_dimension()))
+
+def flush_pending_index(pending_index, faiss_output_path, db_path):
+    """Append the vectors collected in pending_index to the index on disk and empty it."""
+    if pending_index.ntotal:
+        embeddings, chunk_ids = index_contents(pending_index)
+        add_to_faiss_index(embeddings, chunk_ids, faiss_output_path, db_path)
+        pending_index.reset()
+
+def persist_chunks(regulatory_chunks, embeddings, summaries, chunk_sentences,
+                   faiss_output_path="regulatory_index.faiss", db_path="chunks.db",
+                   faiss_index=None):
+    """
+    Write already embedded and summarized chunks to the metadata database and the
+    vector index. Assigns each chunk its chunk_id.
+    
+    When faiss_index is given, vectors are added to that in-memory pending index and the
+    caller flushes it with flush_pending_index (used by bulk loaders to avoid re-reading
+    and re-writing the index file per batch).
+    
+    Returns:
+        list: The chunks, each with its chunk_id.
+    """
+    create_metadata_db(db_path)
     
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
-    logging.debug("Generating summaries and storing chunks...")
-    for i, chunk in enumerate(regulatory_chunks):
-        summary = summarize_chunk(chunk["text"])
+    for chunk, summary in zip(regulatory_chunks, summaries):
         cursor.execute("""
-            INSERT INTO chunks (text, doc_name, page_range, summary)
-            VALUES (?, ?, ?, ?)
-        """, (chunk["text"], chunk["doc_name"], chunk["page_range"], summary))
-        
-        if (i + 1) % 10 == 0:
-            logging.debug(f"Processed {i + 1}/{len(regulatory_chunks)} chunks")
+            INSERT INTO chunks (text, doc_name, page_range, summary, source_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (chunk["text"], chunk["doc_name"], chunk["page_range"], summary, chunk.get("source_id")))
+        chunk["chunk_id"] = cursor.lastrowid
     
-    conn.commit()
+    cursor.executemany("""
+        INSERT OR IGNORE INTO chunk_clauses (doc_name, source_id, chunk_id) VALUES (?, ?, ?)
+    """, [
+        (chunk["doc_name"], clause_id, chunk["chunk_id"])
+        for chunk in regulatory_chunks
+        for clause_id in chunk.get("clause_ids", [])
+    ])
     
-    cursor.execute("SELECT chunk_id, text FROM chunks WHERE text IN ({})".format(
-        ','.join('?' for _ in chunk_texts)), chunk_texts)
-    chunk_id_map = {row[1]: row[0] for row in cursor.fetchall()}
+    cursor.executemany("""
+        INSERT OR REPLACE INTO chunk_sentences (chunk_id, sentence_index, start_offset, end_offset, embedding)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (chunk["chunk_id"], sentence_index, start, end, embedding.tobytes())
+        for chunk, sentences in zip(regulatory_chunks, chunk_sentences)
+        for sentence_index, start, end, embedding in sentences
+    ])
+    conn.commit()
     conn.close()
     
-    for chunk in regulatory_chunks:
-        chunk["chunk_id"] = chunk_id_map[chunk["text"]]
+    if regulatory_chunks and faiss_index is not None:
+        faiss_index.add_with_ids(
+            embeddings, np.array([chunk["chunk_id"] for chunk in regulatory_chunks], dtype=np.int64)
+        )
+    elif regulatory_chunks:
+        add_to_faiss_index(
+            embeddings, [chunk["chunk_id"] for chunk in regulatory_chunks], faiss_output_path, db_path
+        )
     
+    increment("chunks_stored_total", len(regulatory_chunks))
     logging.debug(f"Stored {len(regulatory_chunks)} chunks with summaries in {db_path}")
     return regulatory_chunks
+
+@timed("store_chunks_in_vector_db")
+def store_chunks_in_vector_db(regulatory_chunks, faiss_output_path="regulatory_index.faiss", 
+                            db_path="chunks.db"):
+    embeddings = embed_chunks(regulatory_chunks)
+    chunk_sentences = embed_chunk_sentences(regulatory_chunks)
+    
+    logging.debug("Generating summaries and storing chunks...")
+    summaries = summarize_chunks(regulatory_chunks)
+    
+    return persist_chunks(
+        regulatory_chunks, embeddings, summaries, chunk_sentences,
+        faiss_output_path=faiss_output_path, db_path=db_path
+    )
+
+@timed("store_chunk_stream")
+def store_chunk_stream(chunk_batches, faiss_output_path="regulatory_index.faiss", db_path="chunks.db",
+                       flush_vectors=STREAM_FLUSH_VECTORS):
+    """
+    Embed, summarize and persist chunk batches as they are produced, so only one batch
+    is held at a time. Vectors are collected in memory and appended to the index on disk
+    whenever flush_vectors have accumulated, and once more at the end, so memory stays
+    bounded and a crash leaves at most flush_vectors stored chunks missing from the index.
+    
+    Returns:
+        int: Number of chunks stored.
+    """
+    faiss_index = new_pending_index()
+    
+    stored = 0
+    try:
+        for batch in chunk_batches:
+            if not batch:
+                continue
+            persist_chunks(
+                batch, embed_chunks(batch), summarize_chunks(batch), embed_chunk_sentences(batch),
+                faiss_output_path=faiss_output_path, db_path=db_path, faiss_index=faiss_index
+            )
+            stored += len(batch)
+            logging.debug(f"Stored {stored} chunks so far")
+            if faiss_index.ntotal >= flush_vectors:
+                flush_pending_index(faiss_index, faiss_output_path, db_path)
+    finally:
+        # Batches already committed to SQLite must also be in the index on disk.
+        flush_pending_index(faiss_index, faiss_output_path, db_path)
+    return stored
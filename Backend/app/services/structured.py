@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+
+# Below SQLite's default limit of 999 bound parameters (one more is used for doc_name).
+SOURCE_ID_QUERY_BATCH = 500
+
+def _field(row, name):
+    """A clause field as stripped text; JSONL values may be numbers or other non-strings."""
+    value = row.get(name)
+    return "" if value is None else str(value).strip()
+
+def _jsonl_rows(stream):
+    """Yield (line_number, row) per non-empty JSONL line; row is None when the line is not a JSON object."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+def iter_clause_rows(binary_file, file_format, id_field="id", title_field="title", text_field="text",
+                     skipped=None):
+    """
+    Stream clauses from a CSV or JSONL file one row at a time.
+
+    Args:
+        binary_file: Binary file object (e.g. an upload's spooled file).
+        file_format (str): "csv" or "jsonl".
+        id_field, title_field, text_field (str): Column / key names of the clause fields.
+        skipped (dict): Optional counters, updated in place with the rows skipped for
+            having no text ("no_text") or not being a JSON object ("malformed").
+
+    Yields:
+        dict: {"source_id", "title", "text"} per clause with non-empty text.
+    """
+    stream = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        rows = ((reader.line_num, row) for row in reader)
+    elif file_format == "jsonl":
+        rows = _jsonl_rows(stream)
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+    if skipped is None:
+        skipped = {}
+    skipped.setdefault("no_text", 0)
+    skipped.setdefault("malformed", 0)
+    for line_number, row in rows:
+        if row is None:
+            if not skipped["malformed"]:
+                logging.warning(f"Skipping line {line_number}: not a JSON object")
+            skipped["malformed"] += 1
+            continue
+        text = _field(row, text_field)
+        if not text:
+            skipped["no_text"] += 1
+            continue
+        yield {
+            "source_id": _field(row, id_field) or None,
+            "title": _field(row, title_field),
+            "text": text
+        }
+    if skipped["no_text"]:
+        logging.warning(f"Skipped {skipped['no_text']} rows without {text_field}")
+    if skipped["malformed"]:
+        logging.warning(f"Skipped {skipped['malformed']} lines that are not JSON objects")
+
+def clause_chunks(clauses, doc_name, clauses_per_chunk=1):
+    """
+    Turn clauses into chunks, grouping up to clauses_per_chunk consecutive clauses.
+    A grouped chunk carries the comma-joined ids of its clauses as source_id, the ids
+    themselves as clause_ids and the id range as page_range.
+
+    Yields:
+        dict: Chunks with 'text', 'doc_name', 'page_range', 'source_id', 'clause_ids' and 'title'.
+    """
+    group = []
+
+    def build(group):
+        ids = [clause["source_id"] for clause in group if clause["source_id"]]
+        if not ids:
+            page_range = "N/A"
+        elif len(ids) == 1:
+            page_range = f"clause {ids[0]}"
+        else:
+            page_range = f"clauses {ids[0]}-{ids[-1]}"
+        return {
+            "text": "\n".join(
+                f"{clause['title']}\n{clause['text']}" if clause["title"] else clause["text"]
+                for clause in group
+            ),
+            "doc_name": doc_name,
+            "page_range": page_range,
+            "source_id": ",".join(ids) or None,
+            "clause_ids": ids,
+            "title": "; ".join(clause["title"] for clause in group if clause["title"])
+        }
+
+    for clause in clauses:
+        group.append(clause)
+        if len(group) >= clauses_per_chunk:
+            yield build(group)
+            group = []
+    if group:
+        yield build(group)
+
+def batched(items, batch_size):
+    """Yield lists of up to batch_size items without materializing the input."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def existing_source_ids(db_path, doc_name, source_ids):
+    """
+    Return which of the given clause source ids are already stored for the document,
+    whether as a chunk of their own or within a grouped chunk. Ids are looked up
+    SOURCE_ID_QUERY_BATCH at a time to stay under SQLite's limit on bound parameters.
+    """
+    source_ids = [source_id for source_id in source_ids if source_id]
+    if not source_ids or not os.path.exists(db_path):
+        return set()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    stored = set()
+    try:
+        for batch in batched(source_ids, SOURCE_ID_QUERY_BATCH):
+            cursor.execute("""
+                SELECT DISTINCT source_id FROM chunk_clauses
+                WHERE doc_name = ? AND source_id IN ({})
+            """.format(','.join('?' for _ in batch)), [doc_name] + batch)
+            stored.update(row[0] for row in cursor.fetchall())
+    except sqlite3.OperationalError as e:
+        # No clause table (or no source_id column) yet: nothing is stored.
+        if "no such table" not in str(e) and "no such column" not in str(e):
+            raise
+        return set()
+    finally:
+        conn.close()
+    return stored
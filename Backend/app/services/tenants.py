@@ -0,0 +1,90 @@
+import logging
+import os
+import re
+from collections import namedtuple
+from fastapi import Header, HTTPException
+from .config import (
+    TENANT_ROOT,
+    DEFAULT_TENANT_ID,
+    LLM_CACHE_PATH,
+    SOP_DB_PATH,
+    AUDIT_JOB_DIR,
+)
+from .index_cache import index_cache
+from .shards import index_exists
+
+DEFAULT_FAISS_PATH = "db/regulatory_index.faiss"
+DEFAULT_DB_PATH = "db/chunks.db"
+
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+TenantStorage = namedtuple(
+    "TenantStorage",
+    ["tenant_id", "faiss_path", "db_path", "llm_cache_path", "sop_db_path", "job_root"]
+)
+
+def tenant_storage(tenant_id=None):
+    """
+    Storage locations of a tenant's corpus. The default tenant keeps the original
+    db/ paths; every other tenant has its own directory under TENANT_ROOT, created by
+    the first write to it, so looking up a tenant never touches the disk.
+
+    Raises:
+        ValueError: If the tenant id is not 1-64 letters, digits, '-' or '_'.
+    """
+    tenant_id = tenant_id or DEFAULT_TENANT_ID
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        raise ValueError(f"Invalid tenant id: {tenant_id!r}")
+    if tenant_id == DEFAULT_TENANT_ID:
+        return TenantStorage(
+            tenant_id, DEFAULT_FAISS_PATH, DEFAULT_DB_PATH, LLM_CACHE_PATH, SOP_DB_PATH, AUDIT_JOB_DIR
+        )
+
+    directory = os.path.join(TENANT_ROOT, tenant_id)
+    return TenantStorage(
+        tenant_id,
+        os.path.join(directory, "regulatory_index.faiss"),
+        os.path.join(directory, "chunks.db"),
+        os.path.join(directory, "llm_cache.db"),
+        os.path.join(directory, "sops.db"),
+        os.path.join(directory, "audit_jobs"),
+    )
+
+def get_tenant_storage(x_tenant_id: str = Header(None)) -> TenantStorage:
+    """FastAPI dependency selecting the tenant corpus from the X-Tenant-ID header."""
+    try:
+        return tenant_storage(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def list_tenants():
+    """Ids of the default tenant and every tenant with a storage directory."""
+    tenants = [DEFAULT_TENANT_ID]
+    if os.path.isdir(TENANT_ROOT):
+        tenants.extend(
+            name for name in sorted(os.listdir(TENANT_ROOT))
+            if name != DEFAULT_TENANT_ID and TENANT_ID_PATTERN.match(name)
+            and os.path.isdir(os.path.join(TENANT_ROOT, name))
+        )
+    return tenants
+
+def warm_up(tenant_ids):
+    """
+    Load the vector indexes of the given tenants into the index cache ahead of traffic.
+
+    Returns:
+        dict: tenant_id -> "loaded", "empty" (no index yet) or the error message.
+    """
+    results = {}
+    for tenant_id in tenant_ids:
+        try:
+            storage = tenant_storage(tenant_id)
+            if not index_exists(storage.faiss_path):
+                results[tenant_id] = "empty"
+                continue
+            index_cache.warm(storage.faiss_path, storage.db_path)
+            results[tenant_id] = "loaded"
+        except Exception as e:
+            logging.warning(f"Warm-up of tenant {tenant_id} failed: {e}")
+            results[tenant_id] = str(e)
+    return results
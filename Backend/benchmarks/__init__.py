@@ -0,0 +1,11 @@
+"""
+End-to-end benchmarks for the GraphRAG backend.
+
+Run from the Backend directory:
+
+    python -m benchmarks.run --pages 50 --output bench.json
+    python -m benchmarks.run --pages 50 --baseline bench.json
+
+OpenAI is replaced by a local stub and Neo4j by an in-memory graph, so the
+benchmarks need no API key and no running database.
+"""
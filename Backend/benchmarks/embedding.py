@@ -0,0 +1,130 @@
+"""
+Measure embedding micro-batching under concurrent callers.
+
+    python -m benchmarks.embedding --callers 32 --requests 20
+    python -m benchmarks.embedding --backend onnx --max-wait-ms 2 --output embedding.json
+
+Each of --callers threads issues --requests encode calls of 1 to --texts-per-request
+texts, as concurrent audit requests do at retrieval time. The same load is run once
+with every caller calling the model directly and once through EmbeddingService.
+Reports throughput (texts/sec), per-call latency and the flushed batch sizes, and
+checks that both paths return the same embeddings.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.run import latency_summary
+from benchmarks.inference import synthetic_sentences, embedding_parity
+
+def run_callers(encode, workloads):
+    """Run one thread per workload; each encodes its requests in turn. Returns (elapsed, latencies, outputs)."""
+    latencies = [[] for _ in workloads]
+    outputs = [[] for _ in workloads]
+    start_barrier = threading.Barrier(len(workloads) + 1)
+
+    def caller(position, requests):
+        start_barrier.wait()
+        for texts in requests:
+            begin = time.perf_counter()
+            outputs[position].append(encode(texts))
+            latencies[position].append(time.perf_counter() - begin)
+
+    threads = [threading.Thread(target=caller, args=(i, requests)) for i, requests in enumerate(workloads)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+    return elapsed, [s for samples in latencies for s in samples], outputs
+
+def summarize(elapsed, latencies, total_texts):
+    return {
+        "seconds": elapsed,
+        "texts_per_sec": total_texts / elapsed if elapsed else 0.0,
+        "latency": latency_summary(latencies),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embedding micro-batching benchmark")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--callers", type=int, default=16, help="concurrent caller threads")
+    parser.add_argument("--requests", type=int, default=20, help="encode calls per caller")
+    parser.add_argument("--texts-per-request", type=int, default=3)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--min-similarity", type=float, default=0.999)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    from app.services.inference import load_embedding_model
+    from app.services.embedding_service import EmbeddingService
+    from app.services import metrics
+
+    rng = random.Random(11)
+    sentences = synthetic_sentences(512)
+    workloads = [
+        [rng.sample(sentences, rng.randint(1, args.texts_per_request)) for _ in range(args.requests)]
+        for _ in range(args.callers)
+    ]
+    total_texts = sum(len(texts) for requests in workloads for texts in requests)
+
+    model = load_embedding_model(args.backend)
+    model.encode(sentences[:8], convert_to_numpy=True)
+    service = EmbeddingService(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    direct = run_callers(lambda texts: model.encode(texts, convert_to_numpy=True), workloads)
+    batched = run_callers(service.encode, workloads)
+
+    report = {
+        "config": {
+            "backend": args.backend,
+            "callers": args.callers,
+            "requests_per_caller": args.requests,
+            "texts_per_request": args.texts_per_request,
+            "max_batch_size": args.max_batch_size,
+            "max_wait_ms": args.max_wait_ms,
+        },
+        "direct": summarize(direct[0], direct[1], total_texts),
+        "batched": summarize(batched[0], batched[1], total_texts),
+    }
+    direct_rate = report["direct"]["texts_per_sec"]
+    report["speedup"] = report["batched"]["texts_per_sec"] / direct_rate if direct_rate else None
+
+    batch_sizes = metrics._histograms.get(metrics._key("embedding_batch_size", {"path": "queued"}))
+    if batch_sizes is not None and batch_sizes.count:
+        report["batched"]["flushes"] = batch_sizes.count
+        report["batched"]["mean_batch_size"] = batch_sizes.sum / batch_sizes.count
+
+    parity = embedding_parity(
+        np.concatenate([e for outputs in direct[2] for e in outputs]),
+        np.concatenate([e for outputs in batched[2] for e in outputs]),
+    )
+    parity["threshold"] = args.min_similarity
+    parity["passed"] = parity["min"] >= args.min_similarity
+    report["embedding_parity"] = parity
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if not parity["passed"]:
+        print(f"PARITY FAILED: min cosine similarity {parity['min']:.5f} < {args.min_similarity}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
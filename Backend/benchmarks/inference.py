@@ -0,0 +1,122 @@
+"""
+Compare the PyTorch and ONNX Runtime inference backends.
+
+    python -m benchmarks.inference --batch-sizes 1 8 32 --quantize
+    python -m benchmarks.inference --summarizer --output inference.json
+
+Reports per-batch latency for MiniLM embeddings (and optionally BART summaries)
+on both backends, and checks that ONNX embeddings stay within --min-similarity
+cosine similarity of the PyTorch embeddings. Exits non-zero if parity fails.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.run import latency_summary
+from benchmarks.synthetic import _paragraph
+
+def synthetic_sentences(count, seed=3):
+    rng = random.Random(seed)
+    return [_paragraph(rng, rng.randint(1, 4)) for _ in range(count)]
+
+def time_batches(fn, texts, batch_size, repeats):
+    samples = []
+    for _ in range(repeats):
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            begin = time.perf_counter()
+            fn(batch)
+            samples.append(time.perf_counter() - begin)
+    return latency_summary(samples)
+
+def embedding_parity(reference, candidate):
+    """Row-wise cosine similarity between two embedding matrices."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    similarities = (reference * candidate).sum(axis=1)
+    return {"min": float(similarities.min()), "mean": float(similarities.mean())}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PyTorch vs ONNX Runtime inference benchmark")
+    parser.add_argument("--sentences", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--quantize", action="store_true", help="use dynamic int8 quantization for ONNX")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = default)")
+    parser.add_argument("--summarizer", action="store_true", help="also benchmark BART summarization")
+    parser.add_argument("--summaries", type=int, default=8)
+    parser.add_argument("--min-similarity", type=float, default=None,
+                        help="minimum cosine similarity vs PyTorch (default 0.999, or 0.98 with --quantize)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    from app.services.inference import load_embedding_model, load_summarizer
+
+    min_similarity = args.min_similarity
+    if min_similarity is None:
+        min_similarity = 0.98 if args.quantize else 0.999
+
+    texts = synthetic_sentences(args.sentences)
+    backends = {
+        "torch": load_embedding_model("torch"),
+        "onnx": load_embedding_model("onnx", quantize=args.quantize, intra_op_threads=args.threads),
+    }
+
+    report = {
+        "config": {
+            "sentences": args.sentences,
+            "batch_sizes": args.batch_sizes,
+            "repeats": args.repeats,
+            "quantize": args.quantize,
+            "threads": args.threads,
+        },
+        "embedding": {},
+    }
+    for name, model in backends.items():
+        model.encode(texts[:8], convert_to_numpy=True)
+        report["embedding"][name] = {
+            str(batch_size): time_batches(
+                lambda batch: model.encode(batch, batch_size=batch_size, convert_to_numpy=True),
+                texts, batch_size, args.repeats
+            )
+            for batch_size in args.batch_sizes
+        }
+
+    parity = embedding_parity(
+        backends["torch"].encode(texts, convert_to_numpy=True),
+        backends["onnx"].encode(texts, convert_to_numpy=True),
+    )
+    parity["threshold"] = min_similarity
+    parity["passed"] = parity["min"] >= min_similarity
+    report["embedding_parity"] = parity
+
+    if args.summarizer:
+        chunks = [" ".join(synthetic_sentences(6, seed=i)) for i in range(args.summaries)]
+        report["summarization"] = {}
+        for name in ("torch", "onnx"):
+            summarizer = load_summarizer(name, quantize=args.quantize, intra_op_threads=args.threads)
+            summarize = lambda batch: summarizer(batch[0], max_length=30, min_length=10, do_sample=False)
+            summarize(chunks[:1])
+            report["summarization"][name] = time_batches(summarize, chunks, 1, 1)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if not parity["passed"]:
+        print(f"PARITY FAILED: min cosine similarity {parity['min']:.5f} < {min_similarity}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Compare the reference and vectorized PDF layout engines.
+
+    python -m benchmarks.layout --pages 200 --columns 2
+    python -m benchmarks.layout --pages 200 --images
+    python -m benchmarks.layout --pdf path/to/regulation.pdf --repeats 5
+
+Reports pages/sec for both engines of parse.extract_text_from_page over the same
+pages, and checks that they produce the same layout: identical text once the spaces
+the reference engine puts between the spans of a line are ignored. Pages whose text
+is not byte-identical are listed too. Exits non-zero on a layout mismatch.
+--images embeds a raster figure in every synthetic page, as in scanned or
+illustrated regulations; neither engine extracts image data.
+"""
+import argparse
+import json
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+def add_page_images(pdf_path, size=600):
+    """Embed one raster image in the lower right corner of every page of the PDF."""
+    import fitz
+    doc = fitz.open(pdf_path)
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, size, size), 0)
+    pixmap.clear_with(200)
+    for page in doc:
+        width, height = page.rect.width, page.rect.height
+        page.insert_image(fitz.Rect(width * 0.65, height * 0.8, width * 0.95, height * 0.97), pixmap=pixmap)
+    doc.saveIncr()
+    doc.close()
+
+def layout_key(text):
+    """Page text without spaces and tabs: block order and line breaks only."""
+    return re.sub(r"[ \t]+", "", text)
+
+def time_engine(extract_page, doc, repeats, zone_threshold, horizontal_threshold_ratio):
+    texts = []
+    begin = time.perf_counter()
+    for _ in range(repeats):
+        texts = [extract_page(page, zone_threshold, horizontal_threshold_ratio) for page in doc]
+    elapsed = time.perf_counter() - begin
+    pages = len(doc) * repeats
+    return texts, {
+        "pages": pages,
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed else 0.0,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF layout engine micro-benchmark")
+    parser.add_argument("--pdf", help="benchmark this PDF instead of a synthetic one")
+    parser.add_argument("--pages", type=int, default=100, help="pages in the synthetic PDF")
+    parser.add_argument("--columns", type=int, default=2, help="text columns per synthetic page")
+    parser.add_argument("--paragraphs", type=int, default=4, help="paragraphs per synthetic column")
+    parser.add_argument("--images", action="store_true", help="embed a raster image in every synthetic page")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--zone-threshold", type=float, default=15)
+    parser.add_argument("--horizontal-threshold-ratio", type=float, default=0.2)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    import fitz
+    from app.services.parse import LAYOUT_ENGINES
+    from benchmarks.synthetic import generate_regulation_pdf
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = str(Path(workdir) / "regulation.pdf")
+            generate_regulation_pdf(pdf_path, pages=args.pages, columns=args.columns,
+                                    paragraphs_per_column=args.paragraphs)
+            if args.images:
+                add_page_images(pdf_path)
+        doc = fitz.open(pdf_path)
+
+        report = {
+            "config": {
+                "pdf": args.pdf or "synthetic",
+                "pages": len(doc),
+                "columns": args.columns if args.pdf is None else None,
+                "paragraphs_per_column": args.paragraphs if args.pdf is None else None,
+                "images": args.images and args.pdf is None,
+                "repeats": args.repeats,
+                "zone_threshold": args.zone_threshold,
+                "horizontal_threshold_ratio": args.horizontal_threshold_ratio,
+            },
+            "engines": {},
+        }
+        outputs = {}
+        for name, extract_page in LAYOUT_ENGINES.items():
+            # warm-up pass so both engines start with the same document caches
+            extract_page(doc[0], args.zone_threshold, args.horizontal_threshold_ratio)
+            outputs[name], report["engines"][name] = time_engine(
+                extract_page, doc, args.repeats, args.zone_threshold, args.horizontal_threshold_ratio
+            )
+        doc.close()
+
+    pairs = list(zip(outputs["reference"], outputs["vectorized"]))
+    differing = [i + 1 for i, (a, b) in enumerate(pairs) if a != b]
+    mismatched = [i + 1 for i, (a, b) in enumerate(pairs) if layout_key(a) != layout_key(b)]
+    reference_rate = report["engines"]["reference"]["pages_per_sec"]
+    report["speedup"] = (
+        report["engines"]["vectorized"]["pages_per_sec"] / reference_rate if reference_rate else None
+    )
+    report["identical"] = not differing
+    report["differing_pages"] = differing[:20]
+    report["same_layout"] = not mismatched
+    report["mismatched_pages"] = mismatched[:20]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if mismatched:
+        print(f"LAYOUT MISMATCH on {len(mismatched)} pages", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
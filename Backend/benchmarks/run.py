@@ -0,0 +1,238 @@
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def latency_summary(samples_s):
+    samples_ms = sorted(s * 1000 for s in samples_s)
+    return {
+        "count": len(samples_ms),
+        "mean_ms": sum(samples_ms) / len(samples_ms) if samples_ms else 0.0,
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "p99_ms": percentile(samples_ms, 99),
+    }
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+class BenchmarkReport:
+    def __init__(self, config):
+        self.data = {
+            "commit": current_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": config,
+            "stages": {},
+            "latency": {},
+        }
+
+    def stage(self, name, fn, count, *args, **kwargs):
+        """
+        Run fn once as a named stage and record wall time, throughput and peak RSS.
+        count(result) returns the number of items the stage processed.
+        """
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        items = count(result)
+        self.data["stages"][name] = {
+            "wall_time_s": elapsed,
+            "items": items,
+            "throughput_per_s": items / elapsed if elapsed > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"{name:<24} {elapsed:9.3f}s  {items:>6} items", file=sys.stderr)
+        return result
+
+    def latencies(self, name, fn, inputs):
+        """Call fn once per input and record the latency distribution."""
+        samples = []
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+        self.data["latency"][name] = latency_summary(samples)
+        self.data["latency"][name]["peak_rss_mb"] = peak_rss_mb()
+        summary = self.data["latency"][name]
+        print(f"{name:<24} p50 {summary['p50_ms']:8.1f}ms  p95 {summary['p95_ms']:8.1f}ms  "
+              f"p99 {summary['p99_ms']:8.1f}ms", file=sys.stderr)
+
+def compare_reports(current, baseline, tolerance):
+    """
+    Compare two benchmark reports and return a list of regressions, i.e. stages whose
+    wall time or latency percentiles grew by more than tolerance (a fraction).
+    """
+    regressions = []
+    for name, stage in current["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if previous and previous["wall_time_s"] > 0:
+            change = stage["wall_time_s"] / previous["wall_time_s"] - 1
+            if change > tolerance:
+                regressions.append(f"stage {name}: wall time +{change:.0%}")
+    for name, summary in current["latency"].items():
+        previous = baseline.get("latency", {}).get(name)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if previous[key] > 0:
+                change = summary[key] / previous[key] - 1
+                if change > tolerance:
+                    regressions.append(f"latency {name}: {key} +{change:.0%}")
+    return regressions
+
+def run_benchmarks(args):
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="graphrag-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark-stub")
+    os.environ.setdefault("LLM_CACHE_PATH", str(workdir / "db" / "llm_cache.db"))
+    # The routes resolve their storage paths relative to the working directory.
+    os.chdir(workdir)
+
+    from benchmarks.synthetic import generate_regulation_pdf, generate_sop_docx, generate_queries
+
+    report = BenchmarkReport({
+        "pages": args.pages,
+        "columns": args.columns,
+        "sop_paragraphs": args.sop_paragraphs,
+        "queries": args.queries,
+        "audits": args.audits,
+        "top_k": args.top_k,
+        "llm_latency_ms": args.llm_latency_ms,
+    })
+
+    pdf_path = str(workdir / "synthetic_regulation.pdf")
+    sop_path = str(workdir / "synthetic_sop.docx")
+    generate_regulation_pdf(pdf_path, pages=args.pages, columns=args.columns)
+    generate_sop_docx(sop_path, paragraphs=args.sop_paragraphs)
+    queries = generate_queries(args.queries)
+
+    start = time.perf_counter()
+    from app.main import app
+    from app.services.parse import extract_pdf_text
+    from app.services.preprocess import preprocess_documents
+    from app.services.store import store_chunks_in_vector_db
+    from app.services.entity_relation import process_entity_relations
+    from app.services.retrieval import get_relevant_context
+    from app.routes import regulation_pdf
+    from app.services.tenants import tenant_storage
+    from benchmarks.stubs import install_stubs
+    report.data["stages"]["import_and_model_load"] = {
+        "wall_time_s": time.perf_counter() - start,
+        "items": 1,
+        "throughput_per_s": None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    stub_client, _ = install_stubs(llm_latency_s=args.llm_latency_ms / 1000)
+
+    storage = tenant_storage()
+    faiss_path = storage.faiss_path
+    db_path = storage.db_path
+
+    text = report.stage("extract_pdf_text", extract_pdf_text, lambda _: args.pages, pdf_path)
+    chunks = report.stage(
+        "preprocess_documents", preprocess_documents, len,
+        regulatory_text=text,
+        MIN_tokens=regulation_pdf.REG_MIN_tokens,
+        MAX_tokens=regulation_pdf.REG_MAX_tokens,
+    )
+    report.stage(
+        "store_chunks_in_vector_db", store_chunks_in_vector_db, len,
+        regulatory_chunks=chunks, faiss_output_path=faiss_path, db_path=db_path,
+    )
+    report.stage(
+        "process_entity_relations", process_entity_relations,
+        lambda result: result["total_chunks_processed"], db_path,
+    )
+
+    report.latencies(
+        "get_relevant_context",
+        lambda q: get_relevant_context(q, faiss_path=faiss_path, db_path=db_path, top_k=args.top_k),
+        queries,
+    )
+
+    from fastapi.testclient import TestClient
+    http = TestClient(app)
+    with open(sop_path, "rb") as f:
+        sop_bytes = f.read()
+
+    def audit(query):
+        response = http.post(
+            "/api/audit/search",
+            data={"query": query, "top_k": str(args.top_k)},
+            files={"file": ("synthetic_sop.docx", sop_bytes,
+                            "application/vnd.openxmlformats-officedocument.wordprocessingml.document")},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    audit_queries = queries[:args.audits]
+    report.latencies("audit_search_cold", audit, audit_queries)
+    report.latencies("audit_search_warm", audit, audit_queries)
+    report.data["llm_stub_calls"] = stub_client.chat.completions.calls
+    report.data["workdir"] = str(workdir)
+    return report.data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end GraphRAG backend benchmark")
+    parser.add_argument("--pages", type=int, default=20, help="pages in the synthetic regulation PDF")
+    parser.add_argument("--columns", type=int, default=2, help="text columns per PDF page")
+    parser.add_argument("--sop-paragraphs", type=int, default=20, help="paragraphs in the synthetic SOP")
+    parser.add_argument("--queries", type=int, default=20, help="retrieval queries to time")
+    parser.add_argument("--audits", type=int, default=5, help="audit requests to time")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated OpenAI latency")
+    parser.add_argument("--workdir", help="directory for generated corpora and databases (default: temp dir)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report from a previous commit to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown vs the baseline before failing (fraction)")
+    args = parser.parse_args(argv)
+
+    output = Path(args.output).resolve() if args.output else None
+    baseline = Path(args.baseline).resolve() if args.baseline else None
+
+    results = run_benchmarks(args)
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline:
+        regressions = compare_reports(results, json.loads(baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import asyncio
+from types import SimpleNamespace
+
+class StubChatCompletions:
+    """Stands in for client.chat.completions, returning a canned analysis."""
+
+    def __init__(self, latency_s=0.0, completion_tokens=120):
+        self.latency_s = latency_s
+        self.completion_tokens = completion_tokens
+        self.calls = 0
+
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(
+                content="No compliance issues found in this section."
+            ))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=self.completion_tokens,
+                total_tokens=prompt_tokens + self.completion_tokens
+            )
+        )
+
+class StubAsyncOpenAI:
+    """Minimal local replacement for openai.AsyncOpenAI used by the audit route."""
+
+    def __init__(self, latency_s=0.0):
+        self.chat = SimpleNamespace(completions=StubChatCompletions(latency_s=latency_s))
+
+class InMemoryGraph:
+    """
+    Containerless replacement for the Neo4j graph. Understands the Cypher statements
+    issued by entity_relation.store_in_neo4j and retrieval.get_relevant_context.
+    """
+
+    def __init__(self):
+        self.entities = {}
+        self.relations = {}
+
+    def _add_entity(self, name, type, doc_name, chunk_id, tenant):
+        key = (name, type, doc_name, tenant)
+        chunk_ids = self.entities.setdefault(key, [])
+        if chunk_id not in chunk_ids:
+            chunk_ids.append(chunk_id)
+
+    def _add_relations(self, links, tenant):
+        for link in links:
+            sources = [k for k in self.entities
+                       if k[0] == link["entity1"] and k[2] == link["doc_name1"] and k[3] == tenant]
+            targets = [k for k in self.entities
+                       if k[0] == link["entity2"] and k[2] == link["doc_name2"] and k[3] == tenant]
+            for source in sources:
+                for target in targets:
+                    self.relations[(source, target, link["confidence"])] = link["confidence"]
+
+    def _delete_relations(self, tenant):
+        self.relations = {
+            relation: confidence for relation, confidence in self.relations.items()
+            if relation[0][3] != tenant
+        }
+
+    def _match_entities(self, entity_name, tenant):
+        records = []
+        for key, chunk_ids in self.entities.items():
+            if key[3] != tenant or entity_name.lower() not in key[0].lower():
+                continue
+            related = [
+                (target if source == key else source, confidence)
+                for (source, target, _), confidence in self.relations.items()
+                if key in (source, target)
+            ]
+            if not related:
+                records.append({
+                    "source_chunks": chunk_ids,
+                    "related_chunks": None,
+                    "confidence": None,
+                    "entity_name": key[0]
+                })
+            for other, confidence in related:
+                records.append({
+                    "source_chunks": chunk_ids,
+                    "related_chunks": self.entities[other],
+                    "confidence": confidence,
+                    "entity_name": key[0]
+                })
+        records.sort(key=lambda r: r["confidence"] or 0.0, reverse=True)
+        return records
+
+    def run(self, query, **params):
+        if "MERGE (e:Entity" in query:
+            self._add_entity(**params)
+            return []
+        if "MERGE (e1)-[r:CONTEXT_LINK" in query:
+            self._add_relations(params["links"], params["tenant"])
+            return []
+        if "WHERE e.tenant IS NULL" in query:
+            # entities are always stored with a tenant here
+            return []
+        if "[r:CONTEXT_LINK]->() DELETE r" in query:
+            self._delete_relations(params["tenant"])
+            return []
+        if "CONTAINS toLower($entity_name)" in query:
+            return self._match_entities(params["entity_name"], params["tenant"])
+        raise NotImplementedError(f"InMemoryGraph does not understand query: {query}")
+
+class InMemorySession:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, **params):
+        return self.graph.run(query, **params)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return fn(self, *args, **kwargs)
+
+    execute_read = execute_write
+
+class InMemoryDriver:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def session(self, **kwargs):
+        return InMemorySession(self.graph)
+
+    def close(self):
+        pass
+
+class InMemoryGraphDatabase:
+    """Drop-in for neo4j.GraphDatabase whose drivers all share one InMemoryGraph."""
+
+    def __init__(self):
+        self.graph = InMemoryGraph()
+
+    def driver(self, uri, auth=None, **kwargs):
+        return InMemoryDriver(self.graph)
+
+def install_stubs(llm_latency_s=0.0):
+    """
+    Replace OpenAI and Neo4j in the already-imported app modules with local stubs.
+
+    Returns:
+        tuple: (stub OpenAI client, in-memory graph database)
+    """
+    from app.routes import audit
+    from app.services import entity_relation, retrieval
+
+    client = StubAsyncOpenAI(latency_s=llm_latency_s)
+    graph_db = InMemoryGraphDatabase()
+    audit.client = client
+    entity_relation.GraphDatabase = graph_db
+    retrieval.GraphDatabase = graph_db
+    return client, graph_db
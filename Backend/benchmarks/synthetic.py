@@ -0,0 +1,131 @@
+import random
+import zipfile
+from xml.sax.saxutils import escape
+import fitz  # PyMuPDF
+
+SUBJECTS = [
+    "The manufacturer", "The quality unit", "Each operator", "The responsible person",
+    "The sponsor", "The laboratory", "The batch record", "The validation protocol",
+    "Storage personnel", "The site master file",
+]
+VERBS = [
+    "shall document", "must verify", "shall retain", "must calibrate", "shall review",
+    "must report", "shall approve", "must investigate", "shall label", "must qualify",
+]
+OBJECTS = [
+    "all deviations from approved procedures", "the sodium hydroxide solution concentration",
+    "temperature excursions above 25 degrees Celsius", "equipment cleaning records",
+    "out-of-specification laboratory results", "each lot of acetone received",
+    "the sterility assurance level", "complaints relating to product quality",
+    "training records for all personnel", "the stability study data",
+]
+QUALIFIERS = [
+    "within 30 days", "before release", "at least annually", "in accordance with section {section}",
+    "as defined in Annex {annex}", "prior to use", "without delay", "for a minimum of five years",
+]
+
+def _sentence(rng):
+    qualifier = rng.choice(QUALIFIERS).format(
+        section=f"{rng.randint(1, 20)}.{rng.randint(1, 9)}",
+        annex=rng.randint(1, 15)
+    )
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {qualifier}."
+
+def _paragraph(rng, sentences):
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+def generate_regulation_pdf(path, pages=10, columns=2, paragraphs_per_column=4, seed=0):
+    """
+    Write a synthetic regulation PDF with a full-width heading and multi-column body text.
+
+    Args:
+        path (str): Output PDF path.
+        pages (int): Number of pages.
+        columns (int): Number of text columns per page.
+        paragraphs_per_column (int): Paragraphs written into each column.
+        seed (int): Random seed, so corpora are reproducible across runs.
+
+    Returns:
+        str: The output path.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        width, height = page.rect.width, page.rect.height
+        margin = 40
+        page.insert_textbox(
+            fitz.Rect(margin, margin, width - margin, margin + 30),
+            f"Part {page_number + 1}. Requirements for Good Manufacturing Practice",
+            fontsize=13
+        )
+
+        gutter = 20
+        column_width = (width - 2 * margin - (columns - 1) * gutter) / columns
+        for column in range(columns):
+            x0 = margin + column * (column_width + gutter)
+            text = "\n\n".join(
+                f"{page_number + 1}.{column * paragraphs_per_column + i + 1} {_paragraph(rng, 3)}"
+                for i in range(paragraphs_per_column)
+            )
+            page.insert_textbox(
+                fitz.Rect(x0, margin + 40, x0 + column_width, height - margin),
+                text,
+                fontsize=8
+            )
+    doc.save(path)
+    doc.close()
+    return path
+
+def generate_sop_docx(path, paragraphs=20, seed=1):
+    """
+    Write a synthetic SOP as a minimal DOCX file readable by docx2txt.
+
+    Args:
+        path (str): Output DOCX path.
+        paragraphs (int): Number of body paragraphs.
+        seed (int): Random seed.
+
+    Returns:
+        str: The output path.
+    """
+    rng = random.Random(seed)
+    body = "".join(
+        f"<w:p><w:r><w:t>{escape(f'Step {i + 1}. ' + _paragraph(rng, 4))}</w:t></w:r></w:p>"
+        for i in range(paragraphs)
+    )
+    document_xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/>'
+        '</Relationships>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", content_types)
+        docx.writestr("_rels/.rels", rels)
+        docx.writestr("word/document.xml", document_xml)
+    return path
+
+def generate_queries(count=20, seed=2):
+    """Return synthetic audit queries drawn from the same vocabulary as the corpus."""
+    rng = random.Random(seed)
+    return [
+        f"What must {rng.choice(SUBJECTS).lower()} do about {rng.choice(OBJECTS)}?"
+        for _ in range(count)
+    ]
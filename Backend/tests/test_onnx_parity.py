@@ -0,0 +1,56 @@
+"""
+Parity of the ONNX Runtime sentence encoder with the PyTorch SentenceTransformer.
+
+    pip install -r requirements-onnx.txt pytest
+    python -m pytest tests/test_onnx_parity.py
+
+Skipped when the optional ONNX dependencies are not installed.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("optimum.onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+MIN_COSINE_SIMILARITY = 0.99
+
+SENTENCES = [
+    "The manufacturer shall maintain records of all batch production and control.",
+    "Deviations from approved procedures must be documented and justified.",
+    "Equipment used in the manufacture of drug products shall be of appropriate design.",
+    "Each lot of components shall be withheld from use until it has been sampled and tested.",
+    "Written procedures shall be established for the cleaning and maintenance of equipment.",
+    "short",
+    "",
+]
+
+@pytest.fixture(scope="module")
+def models():
+    from app.services.inference import load_embedding_model
+    return load_embedding_model("torch"), load_embedding_model("onnx", quantize=False)
+
+def test_onnx_embeddings_match_torch(models):
+    torch_model, onnx_model = models
+    expected = torch_model.encode(SENTENCES, convert_to_numpy=True, normalize_embeddings=True)
+    actual = onnx_model.encode(SENTENCES, batch_size=3, convert_to_numpy=True)
+
+    assert actual.shape == expected.shape
+    similarities = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    assert similarities.min() >= MIN_COSINE_SIMILARITY
+
+def test_onnx_single_sentence_matches_batch(models):
+    _, onnx_model = models
+    batch = onnx_model.encode(SENTENCES, convert_to_numpy=True)
+    single = onnx_model.encode(SENTENCES[0], convert_to_numpy=True)
+
+    assert single.shape == (onnx_model.get_sentence_embedding_dimension(),)
+    np.testing.assert_allclose(single, batch[0], atol=1e-5)